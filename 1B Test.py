@@ -1,3 +1,7 @@
+import os
+import json
+import time
+import argparse
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
 from peft import PeftModel
@@ -8,8 +12,11 @@ TEMPERATURE = 0.7 #how ballsy / creative this model can get
 
 def load_models():
     tokenizer = AutoTokenizer.from_pretrained("./model-finetuned-rtx4050", trust_remote_code=True)
-    
-    
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    # decoder-only models continue from the last position, so batched prompts are padded on the left
+    tokenizer.padding_side = "left"
+
     base_model = AutoModelForCausalLM.from_pretrained(
         BASE_MODEL_NAME,
         trust_remote_code=True,
@@ -17,91 +24,15 @@ def load_models():
         device_map="auto",
         low_cpu_mem_usage=True,
     )
-    
-    
-    model = PeftModel.from_pretrained(base_model, "./model-finetuned-rtx4050")
-    model.eval()
-    
-    return model, tokenizer
-
-def generate_response(model, tokenizer, skeleton, userInput):
-    
-    prompt = f"""Interview Question: {skeleton}
-
-Candidate Answer: {userInput}
-
-Provide detailed feedback on this interview answer. Analyze the response for:
-- Clarity
-- Insights
-- Effectiveness
-- How to improve
-
-Feedback:"""
-    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=MAX_LENGTH)
-    
-    if torch.cuda.is_available():
-        inputs = {k: v.cuda() for k, v in inputs.items()}
-    
-    
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=256,
-            temperature=TEMPERATURE,
-            top_p=0.9,
-            do_sample=True,
-            pad_token_id=tokenizer.eos_token_id,
-            repetition_penalty=1.1
-        )
-
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    
-    feedback = response[len(prompt):].strip()
-    
-    return feedback
-
-def main():
-    model, tokenizer = load_models()
-    
-    skeleton = "Tell me about a time when you had to solve a technical challenge under pressure."
-    userInput = """In my web development class, our team built a student portfolio platform and I was responsible for deployment and hosting. I set up the backend on EC2 with auto-scaling for our demo day when 200+ students would access it simultaneously. When our site crashed during initial testing, I quickly configured load balancing and database connection pooling, which allowed us to handle the traffic smoothly.
-"""
-    feedback = generate_response(model, tokenizer, skeleton, userInput)
-    print(feedback)
-    
-
-if __name__== "__main__":
-    main()
-
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from peft import PeftModel
 
-BASE_MODEL_NAME = "deepseek-ai/DeepSeek-R1-Distill-Qwen-1.5B"
-MAX_LENGTH = 1000
-TEMPERATURE = 0.7 #how ballsy / creative this model can get
 
-def load_models():
-    tokenizer = AutoTokenizer.from_pretrained("./model-finetuned-rtx4050", trust_remote_code=True)
-    
-    
-    base_model = AutoModelForCausalLM.from_pretrained(
-        BASE_MODEL_NAME,
-        trust_remote_code=True,
-        torch_dtype=torch.float16,
-        device_map="auto",
-        low_cpu_mem_usage=True,
-    )
-    
-    
     model = PeftModel.from_pretrained(base_model, "./model-finetuned-rtx4050")
     model.eval()
-    
+
     return model, tokenizer
 
-def generate_response(model, tokenizer, skeleton, userInput):
-    
-    prompt = f"""Interview Question: {skeleton}
+def build_prompt(skeleton, userInput):
+    return f"""Interview Question: {skeleton}
 
 Candidate Answer: {userInput}
 
@@ -112,38 +43,114 @@ Provide detailed feedback on this interview answer. Analyze the response for:
 - How to improve
 
 Feedback:"""
-    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=MAX_LENGTH)
-    
+
+def generate_batch(model, tokenizer, pairs, max_new_tokens=256):
+    # returns one (feedback, generated token count) per (question, answer) pair
+    prompts = [build_prompt(skeleton, userInput) for skeleton, userInput in pairs]
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=MAX_LENGTH)
+
     if torch.cuda.is_available():
         inputs = {k: v.cuda() for k, v in inputs.items()}
-    
-    
+
+
     with torch.no_grad():
         outputs = model.generate(
             **inputs,
-            max_new_tokens=256,
+            max_new_tokens=max_new_tokens,
             temperature=TEMPERATURE,
             top_p=0.9,
             do_sample=True,
-            pad_token_id=tokenizer.eos_token_id,
+            pad_token_id=tokenizer.pad_token_id,
             repetition_penalty=1.1
         )
 
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    
-    feedback = response[len(prompt):].strip()
-    
+    # with left padding every prompt ends at the same column, the rest is generated
+    generated = outputs[:, inputs["input_ids"].shape[1]:]
+    results = []
+    for row in generated:
+        # rows that finish early are filled with pad (== eos) up to the longest one
+        finished = (row == tokenizer.eos_token_id).nonzero()
+        length = int(finished[0]) + 1 if len(finished) else len(row)
+        results.append((tokenizer.decode(row[:length], skip_special_tokens=True).strip(), length))
+    return results
+
+def generate_response(model, tokenizer, skeleton, userInput):
+    feedback, _ = generate_batch(model, tokenizer, [(skeleton, userInput)])[0]
     return feedback
 
-def main():
+def read_pairs(path):
+    # one {"question": ..., "answer": ...} object per line, "id" defaults to the line number
+    pairs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f):
+            if line.strip():
+                record = json.loads(line)
+                pairs.append({"id": record.get("id", line_number), "question": record["question"], "answer": record["answer"]})
+    return pairs
+
+def completed_ids(path):
+    done = set()
+    if not os.path.exists(path):
+        return done
+    valid_bytes = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["id"])
+            except (json.JSONDecodeError, KeyError):
+                break
+            if not line.endswith(b"\n"):
+                break
+            valid_bytes += len(line)
+    # drop a line cut off by a crash so new results are not appended onto it
+    with open(path, "r+b") as f:
+        f.truncate(valid_bytes)
+    return done
+
+def run_batch(model, tokenizer, input_path, output_path, batch_size=8, max_new_tokens=256):
+    pairs = read_pairs(input_path)
+    done = completed_ids(output_path)
+    pending = [pair for pair in pairs if pair["id"] not in done]
+    print(f"{len(done)} of {len(pairs)} pairs already generated, {len(pending)} to go")
+
+    # similar prompt lengths in a batch means little padding; longest first so an OOM shows up right away
+    lengths = {pair["id"]: len(tokenizer(build_prompt(pair["question"], pair["answer"]))["input_ids"]) for pair in pending}
+    pending.sort(key=lambda pair: lengths[pair["id"]], reverse=True)
+
+    total_tokens, start = 0, time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as out:
+        for i in range(0, len(pending), batch_size):
+            batch = pending[i:i + batch_size]
+            results = generate_batch(model, tokenizer, [(pair["question"], pair["answer"]) for pair in batch], max_new_tokens)
+            for pair, (feedback, num_tokens) in zip(batch, results):
+                out.write(json.dumps({**pair, "feedback": feedback, "new_tokens": num_tokens}) + "\n")
+                total_tokens += num_tokens
+            out.flush()
+            elapsed = time.perf_counter() - start
+            print(f"{min(i + batch_size, len(pending))}/{len(pending)} pairs, {total_tokens / elapsed:.1f} tokens/sec")
+
+    elapsed = time.perf_counter() - start
+    if pending:
+        print(f"Generated {total_tokens} tokens for {len(pending)} pairs in {elapsed:.1f}s ({total_tokens / elapsed:.1f} tokens/sec)")
+
+def main(input_path=None, output_path="feedback.jsonl", batch_size=8, max_new_tokens=256):
     model, tokenizer = load_models()
-    
+
+    if input_path:
+        run_batch(model, tokenizer, input_path, output_path, batch_size, max_new_tokens)
+        return
+
     skeleton = "Tell me about a time when you had to solve a technical challenge under pressure."
     userInput = """In my web development class, our team built a student portfolio platform and I was responsible for deployment and hosting. I set up the backend on EC2 with auto-scaling for our demo day when 200+ students would access it simultaneously. When our site crashed during initial testing, I quickly configured load balancing and database connection pooling, which allowed us to handle the traffic smoothly.
 """
     feedback = generate_response(model, tokenizer, skeleton, userInput)
     print(feedback)
-    
+
 
 if __name__== "__main__":
-    main()
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--input", dest="input_path", default=None, help="JSONL of question/answer pairs, runs the single example when omitted")
+    arg_parser.add_argument("--output", dest="output_path", default="feedback.jsonl", help="appended to as batches finish, finished ids are skipped on restart")
+    arg_parser.add_argument("--batch-size", type=int, default=8)
+    arg_parser.add_argument("--max-new-tokens", type=int, default=256)
+    main(**vars(arg_parser.parse_args()))
@@ -1,183 +1,61 @@
 import os
 import glob
+import argparse
 import torch
 from transformers import (
     AutoModelForCausalLM,
     AutoTokenizer,
     Trainer,
     TrainingArguments,
-    DataCollatorForLanguageModeling,
     set_seed,
 )
-from datasets import Dataset
-from peft import LoraConfig, get_peft_model
+from datasets import DatasetDict
+from peft import LoraConfig, PeftModel, get_peft_model
+from train_profiler import StepProfiler
+from trainer_callbacks import ProfiledTrainer, PaddingStatsCallback, ThroughputCallback
+from batch_tuner import tune_batch_size
+from corpus_dedup import dedup_files
+from llm_data import split_files, split_incremental, load_manifest, save_manifest, load_token_windows, pack_sequences, add_length_column, PackedDataCollator, DynamicPaddingCollator
 
 modelType = "deepseek-ai/DeepSeek-R1-Distill-Qwen-1.5B"
 
-def prepare_dataset(data_dir, tokenizer, max_seq_length):
+def prepare_dataset(data_dir, tokenizer, max_seq_length, packing=False, stride=0, num_proc=None, dedup_threshold=None, manifest=None, replay_fraction=0.0):
     text_files = glob.glob(os.path.join(data_dir, "*.txt"))
-    
-    all_texts = []
-    for file_path in text_files:
-        with open(file_path, "r", encoding="utf-8") as f:
-            text = f.read()
-            if text.strip():
-                if len(text) > max_seq_length * 10:
-                    text = text[:max_seq_length * 10]
-                all_texts.append(text)
-    
-    def tokenizeFunction(examples):
-        results = tokenizer(
-            examples["text"],
-            truncation=True,
-            max_length=max_seq_length,
-            padding="max_length",
-        )
-        return {
-            "input_ids": results["input_ids"],
-            "attention_mask": results["attention_mask"],
-        }
-    
-    dataset = Dataset.from_dict({"text": all_texts})
-    tokenized_dataset = dataset.map(
-            tokenizeFunction,
-            batched=True,
-            batch_size=2,
-            remove_columns=["text"],
-    )
-    
-    return tokenized_dataset.train_test_split(test_size=0.05, seed=42)
-
-def tokenizerFunction():
-    tokenizer = AutoTokenizer.from_pretrained(modelType, use_fast=True, trust_remote_code=True)
-    
-    if tokenizer.pad_token is None:
-            tokenizer.pad_token = tokenizer.eos_token
-    
-    model = AutoModelForCausalLM.from_pretrained(
-        modelType,
-        trust_remote_code=True,
-        torch_dtype=torch.float16,
-        device_map="auto",
-        low_cpu_mem_usage=True,
-        use_cache=False,
-    )
-    
-    model.gradient_checkpointing_enable()
-    
-    peft_config = LoraConfig(
-        r=4,
-        lora_alpha=8,
-        target_modules=["q_proj", "v_proj"],
-        lora_dropout=0.05,
-        bias="none",
-        task_type="CAUSAL_LM",
-    )
-    
-    model = get_peft_model(model, peft_config)
-    return model, tokenizer
-
-def main():
-    set_seed(33993)
-    torch.cuda.empty_cache()
-    
-    os.makedirs("./model-finetuned-rtx4050", exist_ok=True)
-    
-    model, tokenizer = tokenizerFunction()
-    datasets = prepare_dataset('./data', tokenizer, 1000)
-    
-    data_collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
-    
-    training_args = TrainingArguments(
-        output_dir="./model-finetuned-rtx4050",
-        overwrite_output_dir=True,
-        num_train_epochs=1,
-        per_device_train_batch_size=1,
-        per_device_eval_batch_size=1,
-        gradient_accumulation_steps=4,
-        learning_rate=1e-4,
-        weight_decay=0.01,
-        warmup_steps=50,
-        logging_steps=20,
-        save_strategy="steps",
-        eval_strategy="steps",
-        eval_steps=200,
-        save_steps=400,
-        save_total_limit=1,
-        load_best_model_at_end=True,
-        bf16=True,
-        gradient_checkpointing=True,
-        max_grad_norm=1.0,
-        lr_scheduler_type="cosine",
-        metric_for_best_model="eval_loss",
-    )
-    
-    trainer = Trainer(
-        model=model,
-        args=training_args,
-        data_collator=data_collator,
-        train_dataset=datasets["train"],
-        eval_dataset=datasets["test"],
-    )
-    
-    trainer.train()
-    trainer.save_model("./model-finetuned-rtx4050")
-    tokenizer.save_pretrained("./model-finetuned-rtx4050")
-
-if __name__ == "__main__":
-    main()
-
-import os
-import glob
-import torch
-from transformers import (
-    AutoModelForCausalLM,
-    AutoTokenizer,
-    Trainer,
-    TrainingArguments,
-    DataCollatorForLanguageModeling,
-    set_seed,
-)
-from datasets import Dataset
-from peft import LoraConfig, get_peft_model
+    if not text_files:
+        raise ValueError(f"No .txt files found in {data_dir}")
+    if dedup_threshold:
+        text_files = dedup_files(text_files, dedup_threshold, num_proc=num_proc, cache_dir=os.path.join(data_dir, ".dedup_cache"), tokenizer=tokenizer)
+    
+    replay_files = []
+    if manifest is not None:
+        train_files, replay_files, test_files = split_incremental(text_files, manifest, replay_fraction, 42, 0.05)
+        if not train_files:
+            return None, text_files
+        # the adapter has now seen every file: the old ones before, the new ones in this run
+        trained_files = text_files
+    else:
+        train_files, test_files = split_files(text_files, 0.05, 42)
+        # held-out files stay out of the manifest so a later incremental run trains on them
+        trained_files = train_files
+    
+    # windows are streamed to Arrow on disk (flat memory) by parallel workers and cached by corpus content
+    def windowDataset(file_paths):
+        return load_token_windows(file_paths, tokenizer, max_seq_length, stride, packing, os.path.join(data_dir, ".token_cache"), num_proc)
+    
+    splits = DatasetDict({"train": windowDataset(train_files + replay_files)})
+    if test_files:
+        splits["test"] = windowDataset(test_files)
+    if packing:
+        splits = DatasetDict({name: pack_sequences(split, max_seq_length) for name, split in splits.items()})
+    else:
+        splits = DatasetDict({name: add_length_column(split) for name, split in splits.items()})
+    if "test" in splits and len(splits["test"]) == 0:
+        del splits["test"]
+    if "test" not in splits:
+        print("Warning: too few files for a held-out test split, training without evaluation")
+    return splits, trained_files
 
-modelType = "deepseek-ai/DeepSeek-R1-Distill-Qwen-1.5B"
-
-def prepare_dataset(data_dir, tokenizer, max_seq_length):
-    text_files = glob.glob(os.path.join(data_dir, "*.txt"))
-    
-    all_texts = []
-    for file_path in text_files:
-        with open(file_path, "r", encoding="utf-8") as f:
-            text = f.read()
-            if text.strip():
-                if len(text) > max_seq_length * 10:
-                    text = text[:max_seq_length * 10]
-                all_texts.append(text)
-    
-    def tokenizeFunction(examples):
-        results = tokenizer(
-            examples["text"],
-            truncation=True,
-            max_length=max_seq_length,
-            padding="max_length",
-        )
-        return {
-            "input_ids": results["input_ids"],
-            "attention_mask": results["attention_mask"],
-        }
-    
-    dataset = Dataset.from_dict({"text": all_texts})
-    tokenized_dataset = dataset.map(
-            tokenizeFunction,
-            batched=True,
-            batch_size=2,
-            remove_columns=["text"],
-    )
-    
-    return tokenized_dataset.train_test_split(test_size=0.05, seed=42)
-
-def tokenizerFunction():
+def tokenizerFunction(adapter_dir=None):
     tokenizer = AutoTokenizer.from_pretrained(modelType, use_fast=True, trust_remote_code=True)
     
     if tokenizer.pad_token is None:
@@ -203,55 +81,97 @@ def tokenizerFunction():
         task_type="CAUSAL_LM",
     )
     
-    model = get_peft_model(model, peft_config)
+    if adapter_dir:
+        model = PeftModel.from_pretrained(model, adapter_dir, is_trainable=True)
+    else:
+        model = get_peft_model(model, peft_config)
     return model, tokenizer
 
-def main():
+def main(profile_dir=None, profile_start=5, profile_steps=20, packing=False, boundary_masking=False, stride=0, num_proc=None, auto_batch=False, target_batch_size=4, peak_tflops=None, dedup_threshold=None, incremental=False, replay_fraction=0.0):
     set_seed(33993)
     torch.cuda.empty_cache()
     
     os.makedirs("./model-finetuned-rtx4050", exist_ok=True)
-    
-    model, tokenizer = tokenizerFunction()
-    datasets = prepare_dataset('./data', tokenizer, 1000)
-    
-    data_collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
+    manifest_path = os.path.join("./model-finetuned-rtx4050", "trained_files.json")
+    
+    # incremental runs continue the saved adapter on files the manifest has not seen
+    resume_adapter = incremental and os.path.exists(os.path.join("./model-finetuned-rtx4050", "adapter_config.json"))
+    model, tokenizer = tokenizerFunction("./model-finetuned-rtx4050" if resume_adapter else None)
+    manifest = load_manifest(manifest_path) if resume_adapter else None
+    datasets, trained_files = prepare_dataset('./data', tokenizer, 1000, packing, stride, num_proc, dedup_threshold, manifest, replay_fraction)
+    if datasets is None:
+        print("No new or changed files since the last run, adapter is up to date")
+        return
+    has_eval = "test" in datasets
+    
+    if packing:
+        data_collator = PackedDataCollator(tokenizer.pad_token_id, boundary_masking, mask_dtype=model.dtype)
+    else:
+        data_collator = DynamicPaddingCollator(tokenizer.pad_token_id)
+    
+    micro_batch, accumulation = 1, target_batch_size
+    if auto_batch:
+        micro_batch, accumulation = tune_batch_size(model, 1000, target_batch_size, int(os.environ.get("WORLD_SIZE", 1)))
     
     training_args = TrainingArguments(
         output_dir="./model-finetuned-rtx4050",
         overwrite_output_dir=True,
         num_train_epochs=1,
-        per_device_train_batch_size=1,
-        per_device_eval_batch_size=1,
-        gradient_accumulation_steps=4,
+        per_device_train_batch_size=micro_batch,
+        per_device_eval_batch_size=micro_batch,
+        gradient_accumulation_steps=accumulation,
         learning_rate=1e-4,
         weight_decay=0.01,
         warmup_steps=50,
         logging_steps=20,
         save_strategy="steps",
-        eval_strategy="steps",
+        eval_strategy="steps" if has_eval else "no",
         eval_steps=200,
         save_steps=400,
         save_total_limit=1,
-        load_best_model_at_end=True,
+        load_best_model_at_end=has_eval,
         bf16=True,
         gradient_checkpointing=True,
         max_grad_norm=1.0,
         lr_scheduler_type="cosine",
         metric_for_best_model="eval_loss",
+        remove_unused_columns=not packing,
+        group_by_length=not packing,
     )
     
-    trainer = Trainer(
+    trainer_kwargs = dict(
         model=model,
         args=training_args,
         data_collator=data_collator,
         train_dataset=datasets["train"],
-        eval_dataset=datasets["test"],
+        eval_dataset=datasets.get("test"),
     )
+    if profile_dir:
+        trainer = ProfiledTrainer(profiler=StepProfiler(profile_dir, profile_start, profile_steps), **trainer_kwargs)
+    else:
+        trainer = Trainer(**trainer_kwargs)
+    trainer.add_callback(PaddingStatsCallback(data_collator))
+    trainer.add_callback(ThroughputCallback(data_collator, peak_tflops))
     
     trainer.train()
     trainer.save_model("./model-finetuned-rtx4050")
     tokenizer.save_pretrained("./model-finetuned-rtx4050")
+    save_manifest(manifest_path, trained_files)
 
 if __name__ == "__main__":
-    main()
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--profile-dir", default=None, help="write a Chrome trace and per-step timing summary here")
+    arg_parser.add_argument("--profile-start", type=int, default=5)
+    arg_parser.add_argument("--profile-steps", type=int, default=20)
+    arg_parser.add_argument("--packing", action="store_true", help="concatenate documents into full-length blocks instead of padding each one")
+    arg_parser.add_argument("--boundary-masking", action="store_true", help="with --packing, stop attention across document boundaries")
+    arg_parser.add_argument("--stride", type=int, default=0, help="tokens shared by consecutive windows of a long document")
+    arg_parser.add_argument("--num-proc", type=int, default=None, help="tokenization processes, defaults to the CPU count")
+    arg_parser.add_argument("--auto-batch", action="store_true", help="probe the largest micro-batch that fits and derive gradient accumulation")
+    arg_parser.add_argument("--target-batch-size", type=int, default=4, help="global batch size per optimizer step")
+    arg_parser.add_argument("--dedup-threshold", type=float, default=None, help="drop exact and MinHash near-duplicate documents above this Jaccard similarity, e.g. 0.85")
+    arg_parser.add_argument("--incremental", action="store_true", help="continue the saved adapter on new or changed corpus files only")
+    arg_parser.add_argument("--replay-fraction", type=float, default=0.0, help="with --incremental, share of already-trained files mixed back in")
+    arg_parser.add_argument("--peak-tflops", type=float, default=None, help="per-device peak bf16 TFLOPs, enables the MFU estimate")
+    args = arg_parser.parse_args()
+    main(**vars(args))
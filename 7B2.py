@@ -1,65 +1,63 @@
 import os
 import glob
 import json
+import argparse
 import torch
 from datetime import datetime
 from typing import Dict
 
-from transformers import AutoModelForCausalLM, AutoTokenizer, Trainer, TrainingArguments, DataCollatorForLanguageModeling, BitsAndBytesConfig
+from transformers import AutoModelForCausalLM, AutoTokenizer, Trainer, TrainingArguments, BitsAndBytesConfig
 
-from datasets import Dataset
 from peft import (
     LoraConfig,
+    PeftModel,
     get_peft_model,
 )
+from train_profiler import StepProfiler
+from trainer_callbacks import ProfiledTrainer, PaddingStatsCallback, ThroughputCallback
+from batch_tuner import tune_batch_size
+from corpus_dedup import dedup_files
+from llm_data import split_files, split_incremental, load_manifest, save_manifest, load_token_windows, pack_sequences, add_length_column, PackedDataCollator, DynamicPaddingCollator
 
-def prepare_data(data_path: str, text_processor, max_length: int, val_split: float = 0.05) -> Dict[str, Dataset]:
+def prepare_data(data_path: str, text_processor, max_length: int, val_split: float = 0.05, packing: bool = False, stride: int = 0, num_proc: int = None, dedup_threshold: float = None, manifest: Dict[str, str] = None, replay_fraction: float = 0.0):
     text_files = glob.glob(os.path.join(data_path, "*.txt"))
+    if not text_files:
+        raise ValueError(f"No .txt files found in {data_path}")
+    if dedup_threshold:
+        text_files = dedup_files(text_files, dedup_threshold, num_proc=num_proc, cache_dir=os.path.join(data_path, ".dedup_cache"), tokenizer=text_processor)
+    
+    # with a manifest every new or changed file is trained on, eval files come from the already-trained ones
+    replay_files = []
+    if manifest is not None:
+        train_files, replay_files, val_files = split_incremental(text_files, manifest, replay_fraction, 3944, val_split)
+        if not train_files:
+            return None, text_files
+        # the adapter has now seen every file: the old ones before, the new ones in this run
+        trained_files = text_files
+    else:
+        train_files, val_files = split_files(text_files, val_split, 3944)
+        # held-out files stay out of the manifest so a later incremental run trains on them
+        trained_files = train_files
     
-    all_content = []
-    for file_path in text_files:
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
-            if content.strip():
-                if len(content) > max_length * 10:
-                    content = content[:max_length * 10]
-                all_content.append(content)
-    
-    def process_text(examples):
-        results = text_processor(
-            examples["text"],
-            truncation=True,
-            max_length=max_length,
-            padding="max_length",
-        )
-        
-        return {
-            "input_ids": results["input_ids"],
-            "attention_mask": results["attention_mask"],
-        }
-    
-    data = Dataset.from_dict({"text": all_content})
-    
-    processed_data = data.map(
-        process_text,
-        batched=True,
-        batch_size=2,
-        remove_columns=["text"],
-    )
+    # windows are streamed to Arrow on disk (flat memory) by parallel workers and cached by corpus content
+    def stream_windows(file_paths):
+        return load_token_windows(file_paths, text_processor, max_length, stride, packing, os.path.join(data_path, ".token_cache"), num_proc)
     
-    if val_split > 0:
-        split_data = processed_data.train_test_split(
-            test_size=val_split, 
-            seed=3944
-        )
-        return {
-            "train": split_data["train"],
-            "validation": split_data["test"]
-        }
+    splits = {"train": stream_windows(train_files + replay_files)}
+    if val_files:
+        splits["validation"] = stream_windows(val_files)
+    
+    if packing:
+        splits = {name: pack_sequences(split, max_length) for name, split in splits.items()}
     else:
-        return {"train": processed_data}
+        splits = {name: add_length_column(split) for name, split in splits.items()}
+    if "validation" in splits and len(splits["validation"]) == 0:
+        del splits["validation"]
+    if "validation" not in splits:
+        print("Warning: too few files for a held-out validation split, training without evaluation")
+    return splits, trained_files
 
-def load_model_and_processor():
+def load_model_and_processor(adapter_path=None):
     torch.cuda.empty_cache()
     
     model_path = "deepseek-ai/DeepSeek-R1-Distill-Qwen-7B" # main change from 1.5B 
@@ -104,73 +102,116 @@ def load_model_and_processor():
         task_type="CAUSAL_LM",
     )
     
-    network = get_peft_model(network, lora_settings)
+    if adapter_path:
+        network = PeftModel.from_pretrained(network, adapter_path, is_trainable=True)
+    else:
+        network = get_peft_model(network, lora_settings)
     network.print_trainable_parameters()
     
     return network, text_processor
 
-def main():    
+def main(profile_dir=None, profile_start=5, profile_steps=20, packing=False, boundary_masking=False, stride=0, num_proc=None, auto_batch=False, target_batch_size=4, peak_tflops=None, dedup_threshold=None, incremental=False, replay_fraction=0.0):
     save_dir = "./saved-model"
     os.makedirs(save_dir, exist_ok=True)
+    manifest_path = os.path.join(save_dir, "trained_files.json")
     
-    network, text_processor = load_model_and_processor()
+    # incremental runs keep training the saved adapter, on files it has not seen yet
+    resume_adapter = incremental and os.path.exists(os.path.join(save_dir, "adapter_config.json"))
+    network, text_processor = load_model_and_processor(save_dir if resume_adapter else None)
     
-    training_data = prepare_data(
+    training_data, trained_files = prepare_data(
         "./data", 
         text_processor, 
         1024,
-        0.05
+        0.05,
+        packing,
+        stride,
+        num_proc,
+        dedup_threshold,
+        load_manifest(manifest_path) if resume_adapter else None,
+        replay_fraction
     )
+    if training_data is None:
+        print("No new or changed files since the last run, adapter is up to date")
+        return
+    has_validation = "validation" in training_data
     
-    data_handler = DataCollatorForLanguageModeling(
-        tokenizer=text_processor,
-        mlm=False,
-    )
+    if packing:
+        data_handler = PackedDataCollator(text_processor.pad_token_id, boundary_masking, mask_dtype=network.dtype)
+    else:
+        data_handler = DynamicPaddingCollator(text_processor.pad_token_id)
+    
+    micro_batch, accumulation = 1, target_batch_size
+    if auto_batch:
+        micro_batch, accumulation = tune_batch_size(network, 1024, target_batch_size, int(os.environ.get("WORLD_SIZE", 1)))
     
     training_config = TrainingArguments(
         output_dir=save_dir,
         overwrite_output_dir=True,
         num_train_epochs=3,
-        per_device_train_batch_size=1,
-        per_device_eval_batch_size=1,
-        gradient_accumulation_steps=4,
+        per_device_train_batch_size=micro_batch,
+        per_device_eval_batch_size=micro_batch,
+        gradient_accumulation_steps=accumulation,
         learning_rate=5e-5,
         weight_decay=0.01,
         warmup_steps=50,
         logging_dir=os.path.join(save_dir, "logs"),
         logging_steps=20,
         save_strategy="steps",
-        eval_strategy="steps",
+        eval_strategy="steps" if has_validation else "no",
         eval_steps=200,
         save_steps=800,
         save_total_limit=1,
-        load_best_model_at_end=True,
+        load_best_model_at_end=has_validation,
         fp16=False,
         bf16=True,
         optim="adamw_torch",
         dataloader_num_workers=0,
         dataloader_pin_memory=False,
-        group_by_length=False,
+        group_by_length=not packing,
         gradient_checkpointing=True,
         max_grad_norm=1.0,
         lr_scheduler_type="cosine",
         disable_tqdm=False,
         metric_for_best_model="eval_loss",
+        remove_unused_columns=not packing,
     )
     
-    trainer = Trainer(
+    trainer_settings = dict(
         model=network,
         args=training_config,
         data_collator=data_handler,
         train_dataset=training_data["train"],
         eval_dataset=training_data.get("validation", None),
     )
+    if profile_dir:
+        trainer = ProfiledTrainer(profiler=StepProfiler(profile_dir, profile_start, profile_steps), **trainer_settings)
+    else:
+        trainer = Trainer(**trainer_settings)
+    trainer.add_callback(PaddingStatsCallback(data_handler))
+    trainer.add_callback(ThroughputCallback(data_handler, peak_tflops))
     
     trainer.train()
     
     trainer.save_model(save_dir)
     text_processor.save_pretrained(save_dir)
+    save_manifest(manifest_path, trained_files)
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--profile-dir", default=None, help="write a Chrome trace and per-step timing summary here")
+    arg_parser.add_argument("--profile-start", type=int, default=5)
+    arg_parser.add_argument("--profile-steps", type=int, default=20)
+    arg_parser.add_argument("--packing", action="store_true", help="concatenate documents into full-length blocks instead of padding each one")
+    arg_parser.add_argument("--boundary-masking", action="store_true", help="with --packing, stop attention across document boundaries")
+    arg_parser.add_argument("--stride", type=int, default=0, help="tokens shared by consecutive windows of a long document")
+    arg_parser.add_argument("--num-proc", type=int, default=None, help="tokenization processes, defaults to the CPU count")
+    arg_parser.add_argument("--auto-batch", action="store_true", help="probe the largest micro-batch that fits and derive gradient accumulation")
+    arg_parser.add_argument("--target-batch-size", type=int, default=4, help="global batch size per optimizer step")
+    arg_parser.add_argument("--dedup-threshold", type=float, default=None, help="drop exact and MinHash near-duplicate documents above this Jaccard similarity, e.g. 0.85")
+    arg_parser.add_argument("--incremental", action="store_true", help="continue the saved adapter on new or changed corpus files only")
+    arg_parser.add_argument("--replay-fraction", type=float, default=0.0, help="with --incremental, share of already-trained files mixed back in")
+    arg_parser.add_argument("--peak-tflops", type=float, default=None, help="per-device peak bf16 TFLOPs, enables the MFU estimate")
+    args = arg_parser.parse_args()
     torch.cuda.empty_cache()
-    main()
\ No newline at end of file
+    main(**vars(args))
\ No newline at end of file
@@ -1,8 +1,21 @@
 import PyPDF2
 import os
+import sys
+import glob
 import json
 import re
+import time
+import random
+import hashlib
+import asyncio
+import argparse
+import tempfile
 import datetime
+import threading
+import itertools
+import openai
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dotenv import load_dotenv
 from dateutil import parser
 from langchain_openai import ChatOpenAI
@@ -11,9 +24,84 @@ from langchain.tools import tool
 from langchain.prompts import ChatPromptTemplate
 import uuid
 
+try:
+    import fitz  # PyMuPDF, a much faster text extractor than PyPDF2, used with --pdf-backend pymupdf
+except ImportError:
+    fitz = None
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+try:
+    import torch  # only the local extraction backend needs it
+except ImportError:
+    torch = None
+
 load_dotenv(".env.local")
 
-def get_text_from_pdf(pdf_path):
+# below this many pages starting worker processes costs more than it saves
+PARALLEL_MIN_PAGES = 16
+
+# one process pool for every long PDF, so concurrent extractions (bulk ingestion runs several in
+# threads) queue their page ranges on cpu_count workers instead of each starting a pool of its own
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+def _get_page_pool():
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+        return _page_pool
+
+def _page_count(pdf_path, backend):
+    if backend == "pymupdf":
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count
+    with open(pdf_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+def _extract_pages(pdf_path, start, stop, backend):
+    # returns (page number, text, seconds) for pages [start, stop); every call opens its own reader
+    # so worker processes share no parser state
+    pages = []
+    if backend == "pymupdf":
+        with fitz.open(pdf_path) as doc:
+            for number in range(start, stop):
+                page_start = time.perf_counter()
+                page_text = doc[number].get_text()
+                pages.append((number, page_text or "", time.perf_counter() - page_start))
+        return pages
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for number in range(start, stop):
+            page_start = time.perf_counter()
+            page_text = reader.pages[number].extract_text()
+            pages.append((number, page_text or "", time.perf_counter() - page_start))
+    return pages
+
+def get_text_from_pdf(pdf_path, num_proc=None, backend="pypdf2", timings=None):
+    # long PDFs are split into num_proc contiguous page ranges run on the shared pool. backend="pymupdf"
+    # opts into the faster PyMuPDF reader. timings, when given, is extended with (page number, seconds) for every page
+    if backend == "pymupdf" and fitz is None:
+        raise ImportError("the pymupdf backend needs PyMuPDF (pip install pymupdf)")
+    page_count = _page_count(pdf_path, backend)
+    workers = min(num_proc or os.cpu_count() or 1, page_count)
+    if page_count < PARALLEL_MIN_PAGES or workers <= 1:
+        pages = _extract_pages(pdf_path, 0, page_count, backend)
+    else:
+        bounds = [page_count * i // workers for i in range(workers + 1)]
+        chunks = _get_page_pool().map(_extract_pages, [pdf_path] * workers, bounds[:-1], bounds[1:], [backend] * workers)
+        pages = [page for chunk in chunks for page in chunk]
+    if timings is not None:
+        timings.extend((number, seconds) for number, _, seconds in pages)
+    # a single join instead of growing one string page by page
+    return "".join(page_text for _, page_text, _ in pages)
+
+def _serial_text_from_pdf(pdf_path):
+    # the original extraction loop, kept as the benchmark baseline
     with open(pdf_path, 'rb') as file:
         reader = PyPDF2.PdfReader(file)
         text = ""
@@ -23,73 +111,251 @@ def get_text_from_pdf(pdf_path):
                 text += page_text
     return text
 
+def _synthetic_pdf(pdf_path, num_pages, output_path):
+    # repeats the pages of pdf_path until the document has num_pages pages
+    with open(pdf_path, 'rb') as file:
+        source = PyPDF2.PdfReader(file)
+        writer = PyPDF2.PdfWriter()
+        for number in range(num_pages):
+            writer.add_page(source.pages[number % len(source.pages)])
+        with open(output_path, 'wb') as out:
+            writer.write(out)
+
+def benchmark_extraction(pdf_path="PDF_parser_resume.pdf", synthetic_pages=(50, 200), repeats=3, num_proc=None):
+    def best_of(extract):
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            extract()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    backends = ["pypdf2"] + (["pymupdf"] if fitz is not None else [])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        documents = [pdf_path]
+        for num_pages in synthetic_pages:
+            documents.append(os.path.join(tmp_dir, f"synthetic_{num_pages}.pdf"))
+            _synthetic_pdf(pdf_path, num_pages, documents[-1])
+
+        for document in documents:
+            baseline = best_of(lambda: _serial_text_from_pdf(document))
+            print(f"{os.path.basename(document)} ({_page_count(document, 'pypdf2')} pages): original {baseline * 1000:.1f} ms")
+            for backend in backends:
+                timings = []
+                get_text_from_pdf(document, num_proc, backend, timings)
+                elapsed = best_of(lambda: get_text_from_pdf(document, num_proc, backend))
+                slowest = max(timings, key=lambda timing: timing[1])
+                print(f"  {backend}: {elapsed * 1000:.1f} ms ({baseline / elapsed:.1f}x), mean page {sum(seconds for _, seconds in timings) / len(timings) * 1000:.2f} ms, slowest page {slowest[0]} at {slowest[1] * 1000:.2f} ms")
+
 @tool
 def analyze_resume(text: str) -> str:
     """For resume"""
     return f"Analyzing student resume: {text[:500]}..."
 
-def create_student_resume_agent():
-    llm = ChatOpenAI(model="gpt-4", temperature=0)
-    tools = [analyze_resume]
-    prompt = ChatPromptTemplate.from_messages([
-        (
-            "system",
-            """You are a student career advisor extracting structured data from resumes.
+RESUME_SYSTEM_PROMPT = """You are a student career advisor extracting structured data from resumes.
 Please return ONLY a JSON object with the following structure. 
 If any field is missing in the resume, leave it as an empty string ("") for scalars or empty array ([]) for lists.
 
-{{
-  "name": "",
-  "email": "",
-  "phone": "",
-  "location": "",
-  "summary": "",
-  "education": [
-    {{
-      "field": "",
-      "degree": "",
-      "institution": "",
-      "startDate": "",
-      "endDate": ""
-    }}
-  ],
-  "workExperience": [
-    {{
-      "company": "",
-      "position": "",
-      "startDate": "",
-      "endDate": "",
-      "description": []
-    }}
-  ],
-  "projects": [
-    {{
-      "name": "",
-      "link": "",
-      "description": [],
-      "technologies": []
-    }}
-  ],
-  "skills": [
-    {{
-      "name": ""
-    }}
-  ],
-  "extracurriculars": [
-    {{
-      "name": "",
-      "startDate": "",
-      "endDate": "",
-      "description": ""
-    }}
-  ],
-  "additionalInfo": ""
-}}
+{schema}
 
 All dates must be in YYYY-MM-DD format if possible.
 For work experience and project descriptions, return as arrays of strings.
 For technologies, return as array of strings.
 """
+
+# the JSON shape shown to the model, only the fields still unresolved for a resume go into {schema}
+RESUME_SCHEMA = {
+    "name": "",
+    "email": "",
+    "phone": "",
+    "location": "",
+    "summary": "",
+    "education": [
+        {
+            "field": "",
+            "degree": "",
+            "institution": "",
+            "startDate": "",
+            "endDate": ""
+        }
+    ],
+    "workExperience": [
+        {
+            "company": "",
+            "position": "",
+            "startDate": "",
+            "endDate": "",
+            "description": []
+        }
+    ],
+    "projects": [
+        {
+            "name": "",
+            "link": "",
+            "description": [],
+            "technologies": []
+        }
+    ],
+    "skills": [
+        {
+            "name": ""
+        }
+    ],
+    "extracurriculars": [
+        {
+            "name": "",
+            "startDate": "",
+            "endDate": "",
+            "description": ""
+        }
+    ],
+    "additionalInfo": ""
+}
+
+# bump when ensure_profile_shape expects a different raw JSON shape; cached LLM output is keyed on
+# this and the prompt text, so either change invalidates old entries
+RESUME_SCHEMA_VERSION = 2
+
+class LocalResumeAgent:
+    # stands in for the AgentExecutor (invoke/ainvoke returning {"output": json}) with a locally loaded
+    # model. Decoding walks the requested schema: braces, keys and separators are written by the decoder,
+    # the model only writes string contents and picks whether a list continues, so the output always parses.
+    # One lock guards the model, so it can be shared with other local inference such as feedback generation.
+    # Requests are not batched: each one is decoded on its own under the lock, so callers run at most
+    # max_concurrency of them at a time rather than queueing threads on the lock.
+    backend = "local"
+    max_concurrency = 1
+
+    def __init__(self, model, tokenizer, max_new_tokens=1500, max_items=20, max_string_tokens=120, lock=None, model_name="local"):
+        if torch is None:
+            raise ImportError("the local extraction backend needs torch")
+        self.model = model
+        self.tokenizer = tokenizer
+        self.model_name = model_name
+        self.device = next(model.parameters()).device
+        self.max_new_tokens = max_new_tokens
+        self.max_items = max_items
+        self.max_string_tokens = max_string_tokens
+        self.lock = lock or threading.Lock()
+        self.string_mask = None
+        self.closing_ids = None
+
+    def _build_vocab_masks(self):
+        # tokens that can go inside a JSON string as is: no quote, backslash or control characters. Tokens
+        # with one quote end the string: closing_ids maps them to the text before the quote and whether the
+        # quote is their last character ('abc"'); merged ones like '",' or '"}' are not fed, the decoder
+        # writes the quote and the separator itself
+        def plain(text):
+            return '"' not in text and "\\" not in text and all(ord(char) >= 32 for char in text)
+
+        special = set(self.tokenizer.all_special_ids)
+        vocab_size = self.model.get_output_embeddings().weight.shape[0]
+        self.string_mask = torch.zeros(vocab_size, dtype=torch.bool, device=self.device)
+        self.closing_ids = {}
+        for token_id in range(min(vocab_size, len(self.tokenizer))):
+            if token_id in special:
+                continue
+            piece = self.tokenizer.decode([token_id])
+            if piece and plain(piece):
+                self.string_mask[token_id] = True
+            elif piece.count('"') == 1:
+                prefix, suffix = piece.split('"')
+                if plain(prefix) and not suffix.strip(" ,:}]\n"):
+                    self.closing_ids[token_id] = (prefix, not suffix)
+                    self.string_mask[token_id] = True
+
+    def _feed(self, token_ids):
+        input_ids = torch.tensor([token_ids], device=self.device)
+        outputs = self.model(input_ids=input_ids, past_key_values=self.past, use_cache=True)
+        self.past = outputs.past_key_values
+        self.logits = outputs.logits[0, -1]
+
+    def _append(self, text):
+        self._feed(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def _choose(self, options):
+        # the option whose first token the model rates highest
+        first_ids = [self.tokenizer(option, add_special_tokens=False)["input_ids"][0] for option in options]
+        return options[int(torch.argmax(self.logits[first_ids]))]
+
+    def _string(self):
+        self._append('"')
+        token_ids, closing_id = [], None
+        while len(token_ids) < self.max_string_tokens and self.generated < self.max_new_tokens:
+            token_id = int(torch.argmax(self.logits.masked_fill(~self.string_mask, float("-inf"))))
+            self.generated += 1
+            if token_id in self.closing_ids:
+                closing_id = token_id
+                break
+            token_ids.append(token_id)
+            self._feed([token_id])
+        text = self.tokenizer.decode(token_ids)
+        if closing_id is None:
+            self._append('"')
+            return text.strip()
+        prefix, quote_last = self.closing_ids[closing_id]
+        if quote_last:
+            self._feed([closing_id])
+        else:
+            self._append(prefix + '"')
+        return (text + prefix).strip()
+
+    def _value(self, shape):
+        if isinstance(shape, dict):
+            value = {}
+            for index, (key, item_shape) in enumerate(shape.items()):
+                self._append(("{" if index == 0 else ", ") + json.dumps(key) + ": ")
+                value[key] = self._value(item_shape)
+            self._append("}")
+            return value
+        if isinstance(shape, list):
+            item_shape = shape[0] if shape else ""
+            self._append("[")
+            items = []
+            while len(items) < self.max_items and self.generated < self.max_new_tokens:
+                if self._choose([", " if items else ("{" if isinstance(item_shape, dict) else '"'), "]"]) == "]":
+                    break
+                if items:
+                    self._append(", ")
+                items.append(self._value(item_shape))
+            self._append("]")
+            return items
+        return self._string()
+
+    def invoke(self, agent_input):
+        schema = json.loads(agent_input["schema"])
+        prompt = f"{RESUME_SYSTEM_PROMPT.replace('{schema}', agent_input['schema'])}\n\n{agent_input['input']}\n\nJSON:\n"
+        with self.lock, torch.no_grad():
+            if self.string_mask is None:
+                self._build_vocab_masks()
+            self.past, self.generated = None, 0
+            self._feed(self.tokenizer(prompt)["input_ids"])
+            profile = self._value(schema)
+            self.past = self.logits = None
+        return {"output": json.dumps(profile)}
+
+    async def ainvoke(self, agent_input):
+        return await asyncio.to_thread(self.invoke, agent_input)
+
+OPENAI_RESUME_MODEL = "gpt-4"
+
+def create_student_resume_agent(base_url=None, max_retries=2, backend="openai", model_path="./model-finetuned-rtx4050", local_model=None):
+    # backend="local" extracts with the served fine-tuned model instead of GPT-4; local_model takes an
+    # already loaded (model, tokenizer) so the weights are not loaded twice
+    if backend == "local":
+        if local_model is None:
+            sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app", "Services", "BackendModels"))
+            from load_model import load_finetuned_model
+            local_model = load_finetuned_model(model_path)
+        return LocalResumeAgent(*local_model, model_name=model_path)
+
+    # base_url points the client at another OpenAI-compatible server, e.g. a local stub for testing
+    llm = ChatOpenAI(model=OPENAI_RESUME_MODEL, temperature=0, base_url=base_url, max_retries=max_retries)
+    tools = [analyze_resume]
+    prompt = ChatPromptTemplate.from_messages([
+        (
+            "system",
+            RESUME_SYSTEM_PROMPT
         ),
         ("human", "{input}"),
         ("placeholder", "{agent_scratchpad}"),
@@ -97,32 +363,76 @@ For technologies, return as array of strings.
     agent = create_openai_tools_agent(llm, tools, prompt)
     return AgentExecutor(agent=agent, tools=tools, verbose=False)
 
-def normalize_date(date_str):
-    if not date_str:
-        return ""
-    date_str = date_str.strip()
-    if date_str.lower() == "present":
-        return "" 
+# the shapes most resume dates come in, parsed without dateutil: "2024-01(-15)", "2024/01",
+# "Jan 2024", "January, 2024", "01/2024" and a bare "2024". A missing day or month becomes 01
+DATE_YEAR_FIRST = re.compile(r"(\d{4})[-/.](\d{1,2})(?:[-/.](\d{1,2}))?")
+DATE_MONTH_NAME = re.compile(r"([A-Za-z]{3,9})\.?,?\s+(\d{4})")
+DATE_MONTH_NUMBER = re.compile(r"(\d{1,2})[-/.](\d{4})")
+DATE_YEAR = re.compile(r"(?:19|20)\d{2}")
+MONTH_NAMES = ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december"]
+
+_ID_PREFIX = uuid.uuid4().hex[:4]
+_id_counter = itertools.count()
+
+def new_entry_id():
+    # a per-process random prefix and a counter instead of a uuid4 per entry; 8 hex characters like the
+    # uuid4 slice it replaces for the first 65536 entries, longer after that rather than repeating
+    return f"{_ID_PREFIX}{next(_id_counter):04x}"
+
+def _fast_date(date_str):
+    try:
+        match = DATE_YEAR_FIRST.fullmatch(date_str)
+        if match:
+            return datetime.date(int(match.group(1)), int(match.group(2)), int(match.group(3) or 1)).isoformat()
+        match = DATE_MONTH_NAME.fullmatch(date_str)
+        if match:
+            name = match.group(1).lower()
+            month = next((index for index, full in enumerate(MONTH_NAMES, 1) if full.startswith(name) or (name == "sept" and index == 9)), None)
+            return datetime.date(int(match.group(2)), month, 1).isoformat() if month else None
+        match = DATE_MONTH_NUMBER.fullmatch(date_str)
+        if match:
+            return datetime.date(int(match.group(2)), int(match.group(1)), 1).isoformat()
+        if DATE_YEAR.fullmatch(date_str):
+            return f"{date_str}-01-01"
+    except ValueError:
+        # matched a shape but not a real date ("2024-13"), left for dateutil to try
+        pass
+    return None
+
+def _fuzzy_date(date_str):
     try:
         parsed_date = parser.parse(date_str, fuzzy=True, dayfirst=False)
         return parsed_date.strftime("%Y-%m-%d")
-    except:
+    except (ValueError, OverflowError):
+        return ""
+
+@lru_cache(maxsize=8192)
+def _normalize_date_text(date_str):
+    if date_str.lower() in ("present", "current", "now"):
         return ""
+    fast = _fast_date(date_str)
+    return fast if fast is not None else _fuzzy_date(date_str)
 
-def clean_education_entries(education_list):
+def normalize_date(date_str):
+    # memoized on the stripped text, dates repeat heavily across a cohort
+    if not date_str:
+        return ""
+    return _normalize_date_text(str(date_str).strip())
+
+def clean_education_entries(education_list, normalize=normalize_date, new_id=new_entry_id):
     cleaned = []
     for edu in education_list:
         cleaned.append({
-            "id": str(uuid.uuid4())[:8],
+            "id": new_id(),
             "field": edu.get("field", "") or "",
             "degree": edu.get("degree", "") or "",
             "institution": edu.get("institution", "") or "",
-            "startDate": normalize_date(edu.get("startDate", "")),
-            "endDate": normalize_date(edu.get("endDate", ""))
+            "startDate": normalize(edu.get("startDate", "")),
+            "endDate": normalize(edu.get("endDate", ""))
         })
     return cleaned
 
-def clean_work_entries(work_list):
+def clean_work_entries(work_list, normalize=normalize_date, new_id=new_entry_id):
     cleaned = []
     for work in work_list:
         description = work.get("description", [])
@@ -132,16 +442,16 @@ def clean_work_entries(work_list):
             description = []
         
         cleaned.append({
-            "id": str(uuid.uuid4())[:8],
+            "id": new_id(),
             "company": work.get("company", "") or "",
             "position": work.get("position", "") or "",
-            "startDate": normalize_date(work.get("startDate", "")),
-            "endDate": normalize_date(work.get("endDate", "")),
+            "startDate": normalize(work.get("startDate", "")),
+            "endDate": normalize(work.get("endDate", "")),
             "description": description
         })
     return cleaned
 
-def clean_project_entries(project_list):
+def clean_project_entries(project_list, new_id=new_entry_id):
     cleaned = []
     for project in project_list:
         description = project.get("description", [])
@@ -157,7 +467,7 @@ def clean_project_entries(project_list):
             technologies = []
         
         cleaned.append({
-            "id": str(uuid.uuid4())[:8],
+            "id": new_id(),
             "name": project.get("name", "") or "",
             "link": project.get("link", "") or "",
             "description": description,
@@ -165,34 +475,36 @@ def clean_project_entries(project_list):
         })
     return cleaned
 
-def clean_skills_entries(skills_list):
+def clean_skills_entries(skills_list, new_id=new_entry_id):
     cleaned = []
     for skill in skills_list:
         if isinstance(skill, str):
             cleaned.append({
-                "id": str(uuid.uuid4())[:8],
+                "id": new_id(),
                 "name": skill
             })
         elif isinstance(skill, dict):
             cleaned.append({
-                "id": str(uuid.uuid4())[:8],
+                "id": new_id(),
                 "name": skill.get("name", "") or ""
             })
     return cleaned
 
-def clean_extracurricular_entries(extra_list):
+def clean_extracurricular_entries(extra_list, normalize=normalize_date, new_id=new_entry_id):
     cleaned = []
     for extra in extra_list:
         cleaned.append({
-            "id": str(uuid.uuid4())[:8],
+            "id": new_id(),
             "name": extra.get("name", "") or extra.get("title", "") or "",
-            "startDate": normalize_date(extra.get("startDate", "")),
-            "endDate": normalize_date(extra.get("endDate", "")),
+            "startDate": normalize(extra.get("startDate", "")),
+            "endDate": normalize(extra.get("endDate", "")),
             "description": extra.get("description", "") or ""
         })
     return cleaned
 
-def ensure_profile_shape(parsed_json):
+def ensure_profile_shape(parsed_json, normalize=normalize_date, new_id=new_entry_id):
+    # normalize maps a raw date to YYYY-MM-DD and new_id gives each entry its id; ensure_profile_shapes
+    # passes a batch date table, the benchmark the previous implementations
     profile = {
         "name": "",
         "email": "",
@@ -210,23 +522,667 @@ def ensure_profile_shape(parsed_json):
     for key in ["name", "email", "phone", "location", "summary", "additionalInfo"]:
         profile[key] = parsed_json.get(key, "") or ""
     
-    profile["education"] = clean_education_entries(parsed_json.get("education", []))
-    profile["workExperience"] = clean_work_entries(parsed_json.get("workExperience", []))
-    profile["projects"] = clean_project_entries(parsed_json.get("projects", []))
-    profile["skills"] = clean_skills_entries(parsed_json.get("skills", []))
-    profile["extracurriculars"] = clean_extracurricular_entries(parsed_json.get("extracurriculars", []))
+    profile["education"] = clean_education_entries(parsed_json.get("education", []), normalize, new_id)
+    profile["workExperience"] = clean_work_entries(parsed_json.get("workExperience", []), normalize, new_id)
+    profile["projects"] = clean_project_entries(parsed_json.get("projects", []), new_id)
+    profile["skills"] = clean_skills_entries(parsed_json.get("skills", []), new_id)
+    profile["extracurriculars"] = clean_extracurricular_entries(parsed_json.get("extracurriculars", []), normalize, new_id)
     
     return profile
 
-def parse_student_resume(pdf_path):
-    text = get_text_from_pdf(pdf_path)
-    agent = create_student_resume_agent()
-    result = agent.invoke({"input": f"Extract all the relevant fields from this resume in JSON format: {text}"})
-    raw_output = result.get('output', '').strip()
-    parsed_json = json.loads(raw_output)
+def ensure_profile_shapes(parsed_jsons):
+    # batch form for bulk imports: the distinct dates of the whole batch are normalized once into a table
+    # that every profile then reads from, however many the normalize_date cache could hold
+    parsed_jsons = list(parsed_jsons)
+    dates = {
+        entry.get(key) for parsed_json in parsed_jsons for field in ("education", "workExperience", "extracurriculars")
+        for entry in parsed_json.get(field) or [] if isinstance(entry, dict) for key in ("startDate", "endDate")
+        if isinstance(entry.get(key), (str, int))
+    }
+    table = {date_str: normalize_date(date_str) for date_str in dates}
+
+    def lookup(date_str):
+        return table[date_str] if isinstance(date_str, (str, int)) and date_str in table else normalize_date(date_str)
+
+    return [ensure_profile_shape(parsed_json, lookup) for parsed_json in parsed_jsons]
+
+def _reference_normalize_date(date_str):
+    # the previous implementation, kept as the benchmark baseline
+    if not date_str:
+        return ""
+    date_str = date_str.strip()
+    if date_str.lower() == "present":
+        return ""
+    try:
+        return parser.parse(date_str, fuzzy=True, dayfirst=False).strftime("%Y-%m-%d")
+    except (ValueError, OverflowError):
+        return ""
+
+def benchmark_normalization(num_profiles=5000, seed=0):
+    rng = random.Random(seed)
+    formats = [
+        lambda y, m: f"{y}-{m:02d}", lambda y, m: f"{y}-{m:02d}-15", lambda y, m: f"{MONTH_NAMES[m - 1][:3].title()} {y}",
+        lambda y, m: f"{MONTH_NAMES[m - 1].title()} {y}", lambda y, m: f"{m:02d}/{y}", lambda y, m: str(y),
+        lambda y, m: "Present", lambda y, m: f"Summer {y}",
+    ]
+    def date():
+        return rng.choice(formats)(rng.randint(2010, 2026), rng.randint(1, 12))
+    def entry(**fields):
+        return {"startDate": date(), "endDate": date(), **fields}
+    profiles = [{
+        "name": f"Student {index}",
+        "education": [entry(institution="University", degree="BSc") for _ in range(rng.randint(1, 2))],
+        "workExperience": [entry(company="Company", position="Intern", description=["Built things"]) for _ in range(rng.randint(1, 4))],
+        "projects": [{"name": "Project", "technologies": "Python"} for _ in range(rng.randint(1, 4))],
+        "skills": ["Python", "SQL", {"name": "Git"}],
+        "extracurriculars": [entry(name="Club") for _ in range(rng.randint(0, 2))],
+    } for index in range(num_profiles)]
+    dates = [entry_[key] for profile in profiles for field in ("education", "workExperience", "extracurriculars") for entry_ in profile[field] for key in ("startDate", "endDate")]
+
+    # the same full shaping as before the fast path: dateutil for every date and a uuid4 per entry
+    start = time.perf_counter()
+    [ensure_profile_shape(profile, _reference_normalize_date, lambda: str(uuid.uuid4())[:8]) for profile in profiles]
+    reference = time.perf_counter() - start
+
+    _normalize_date_text.cache_clear()
+    start = time.perf_counter()
+    ensure_profile_shapes(profiles)
+    elapsed = time.perf_counter() - start
+    print(f"{num_profiles} profiles, {len(dates)} dates ({_normalize_date_text.cache_info().currsize} distinct)")
+    print(f"  ensure_profile_shape, dateutil + uuid4: {reference:.2f}s ({num_profiles / reference:.0f} profiles/sec)")
+    print(f"  ensure_profile_shapes: {elapsed:.2f}s ({num_profiles / elapsed:.0f} profiles/sec, {reference / elapsed:.1f}x)")
+
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+# a number after a "Mobile:"/"Phone:" label may take any grouping ("8187 7303", "+65 8187-7303"); an
+# unlabelled one must start with a country code or look like a US (555) 123-4567
+PHONE_LABELLED = re.compile(r"\b(?:mobile|phone|tel|telephone|cell|contact|hp)(?: no\.?| number)?\s*[:.]?[ \t]*(\+?\(?\d[\d \t().-]{5,20}\d)", re.IGNORECASE)
+PHONE_PATTERN = re.compile(r"\+\d{1,3}[ .-]?\(?\d{1,4}\)?(?:[ .-]?\d{2,4}){1,4}\b|(?:\(\d{3}\)|\b\d{3})[ .-]?\d{3}[ .-]?\d{4}\b")
+LINK_PATTERN = re.compile(r"(?:https?://|www\.)\S+|\b(?:linkedin\.com|github\.com)/\S+", re.IGNORECASE)
+SKILL_SEPARATOR = re.compile(r"[,;|\u2022\u00b7]")
+
+# header line -> the profile field its section fills. Matched through _header_key, so case, "&" vs "and",
+# hyphens and plural vs singular ("PROJECT", "Co-Curricular Activities") do not matter
+SECTION_HEADERS = {
+    "summary": "summary", "professional summary": "summary", "objective": "summary", "profile": "summary", "about me": "summary",
+    "education": "education", "academic background": "education", "education and qualifications": "education",
+    "relevant coursework": "education", "coursework": "education",
+    "experience": "workExperience", "work experience": "workExperience", "professional experience": "workExperience",
+    "relevant experience": "workExperience", "employment": "workExperience", "employment history": "workExperience",
+    "internships": "workExperience", "internship experience": "workExperience", "research experience": "workExperience",
+    "projects": "projects", "personal projects": "projects", "academic projects": "projects", "technical projects": "projects",
+    "skills": "skills", "technical skills": "skills", "skills and interests": "skills", "skills and tools": "skills", "technologies": "skills",
+    "extracurriculars": "extracurriculars", "extracurricular activities": "extracurriculars", "co-curricular activities": "extracurriculars",
+    "co-curriculars": "extracurriculars", "activities": "extracurriculars", "leadership": "extracurriculars",
+    "leadership and activities": "extracurriculars", "leadership experience": "extracurriculars", "involvement": "extracurriculars",
+    "volunteering": "extracurriculars", "volunteer experience": "extracurriculars", "community service": "extracurriculars",
+    "certifications": "additionalInfo", "professional certifications": "additionalInfo", "licenses and certifications": "additionalInfo",
+    "certifications and awards": "additionalInfo", "awards": "additionalInfo", "honors": "additionalInfo", "honours": "additionalInfo",
+    "honors and awards": "additionalInfo", "honours and awards": "additionalInfo", "awards and achievements": "additionalInfo",
+    "achievements": "additionalInfo", "languages": "additionalInfo", "interests": "additionalInfo", "publications": "additionalInfo",
+    "additional information": "additionalInfo",
+}
+
+def _header_key(line):
+    words = line.strip().rstrip(":").lower().replace("&", " and ").replace("-", "").split()
+    return " ".join(word[:-1] if len(word) > 3 and word.endswith("s") else word for word in words)
+
+_SECTION_FIELDS = {_header_key(header): field for header, field in SECTION_HEADERS.items()}
+
+# sections that need the model to structure them; summary and skills are taken as written
+LLM_SECTIONS = ["education", "workExperience", "projects", "extracurriculars", "additionalInfo"]
+
+def extract_contact(text):
+    links = []
+    for match in LINK_PATTERN.finditer(text):
+        link = match.group(0).rstrip(".,;)")
+        if link not in links:
+            links.append(link)
+    email = EMAIL_PATTERN.search(text)
+    phone = ""
+    for match in list(PHONE_LABELLED.finditer(text)) + list(PHONE_PATTERN.finditer(text)):
+        candidate = " ".join(match.group(match.lastindex or 0).split())
+        if 7 <= sum(char.isdigit() for char in candidate) <= 15:
+            phone = candidate
+            break
+    return {"email": email.group(0) if email else "", "phone": phone, "links": links}
+
+def segment_resume(text):
+    # splits the text at recognised section header lines; whatever precedes the first one (name, contact
+    # line) is kept under "header". Each section keeps its header line, repeated sections are concatenated
+    sections = {"header": []}
+    current = "header"
+    for line in text.splitlines():
+        field = _SECTION_FIELDS.get(_header_key(line))
+        if field:
+            current = field
+            sections.setdefault(field, [])
+        sections[current].append(line)
+    return {field: "\n".join(lines).strip() for field, lines in sections.items()}
+
+def parse_skills(section_text):
+    skills = []
+    for line in section_text.splitlines()[1:]:
+        # "Languages: Python, Java" lists its skills after the label
+        line = line.split(":", 1)[1] if ":" in line else line
+        for item in SKILL_SEPARATOR.split(line):
+            item = item.strip(" -*\t")
+            if item and len(item) <= 40 and item.lower() not in {skill.lower() for skill in skills}:
+                skills.append(item)
+    return [{"name": skill} for skill in skills]
+
+# prompts above this many tokens are split into section-aligned chunks extracted side by side,
+# which keeps well inside GPT-4's 8k context with room for the JSON answer
+RESUME_TOKEN_BUDGET = 5000
+
+# list field -> entry fields that identify the same entry when two chunks both return it
+MERGE_KEYS = {
+    "education": ("institution", "degree"),
+    "workExperience": ("company", "position", "startDate"),
+    "projects": ("name",),
+    "skills": ("name",),
+    "extracurriculars": ("name",),
+}
+
+@lru_cache(maxsize=None)
+def _encoding():
+    return tiktoken.encoding_for_model("gpt-4") if tiktoken is not None else None
+
+def count_tokens(text):
+    encoding = _encoding()
+    return len(encoding.encode(text)) if encoding is not None else len(text) // 4
+
+def _agent_input(fields, text):
+    return {
+        "input": f"Extract all the relevant fields from this resume in JSON format: {text}",
+        "schema": json.dumps({field: RESUME_SCHEMA[field] for field in fields}, indent=2),
+    }
+
+def request_tokens(agent_input):
+    return count_tokens(RESUME_SYSTEM_PROMPT) + count_tokens(agent_input["schema"]) + count_tokens(agent_input["input"])
+
+def _split_section(section_text, max_tokens):
+    # a section over max_tokens is cut at line boundaries, later pieces repeat its header line
+    lines = section_text.splitlines()
+    pieces, current, used = [], [], 0
+    for line in lines:
+        tokens = count_tokens(line) + 1
+        if current and used + tokens > max_tokens:
+            pieces.append("\n".join(current))
+            current = [f"{lines[0]} (continued)"]
+            used = count_tokens(current[0]) + 1
+        current.append(line)
+        used += tokens
+    pieces.append("\n".join(current))
+    return pieces
+
+def build_resume_request(text, token_budget=RESUME_TOKEN_BUDGET):
+    # returns (fields resolved locally, links found, agent inputs). Only what the patterns actually found is
+    # resolved locally; every other field stays in the model's schema. Fields with their own section are
+    # asked with that section, the rest with the text outside any section (and with every chunk, since
+    # their lines may sit under a header that was not recognised). A resume over token_budget gets one
+    # input per chunk
+    contact = extract_contact(text)
+    prefilled = {field: contact[field] for field in ("email", "phone") if contact[field]}
+    sections = segment_resume(text)
+
+    if len(sections) == 1:
+        # no recognisable headers, the model gets the whole resume for everything not found locally
+        unplaced = [field for field in RESUME_SCHEMA if field not in prefilled]
+        parts = [(unplaced, text)]
+    else:
+        summary = " ".join(" ".join(sections.get("summary", "").splitlines()[1:]).split())
+        if summary:
+            prefilled["summary"] = summary
+        skills = parse_skills(sections.get("skills", ""))
+        if skills:
+            prefilled["skills"] = skills
+        # a summary or skills section the patterns got nothing from goes to the model as well
+        placed = [field for field in LLM_SECTIONS + ["summary", "skills"] if field not in prefilled and sections.get(field)]
+        unplaced = [field for field in RESUME_SCHEMA if field not in prefilled and field not in placed]
+        parts = [(unplaced, sections["header"])] + [([field], sections[field]) for field in placed]
+
+    whole = _agent_input([field for fields, _ in parts for field in fields], "\n\n".join(part for _, part in parts))
+    if request_tokens(whole) <= token_budget:
+        return prefilled, contact["links"], [whole]
+
+    # map step: pack section pieces in document order into chunks of half the budget, leaving the
+    # other half for the system prompt and schema
+    chunks, current, used = [], [], 0
+    for fields, section_text in parts:
+        for piece in _split_section(section_text, token_budget // 2):
+            tokens = count_tokens(piece)
+            if current and used + tokens > token_budget // 2:
+                chunks.append(current)
+                current, used = [], 0
+            current.append((fields, piece))
+            used += tokens
+    chunks.append(current)
+
+    agent_inputs = []
+    for chunk in chunks:
+        fields = list(dict.fromkeys([field for fields, _ in chunk for field in fields] + unplaced))
+        agent_inputs.append(_agent_input(fields, "\n\n".join(piece for _, piece in chunk)))
+    return prefilled, contact["links"], agent_inputs
+
+def _entry_key(entry, key_fields):
+    if not isinstance(entry, dict):
+        return " ".join(str(entry).lower().split())
+    return tuple(" ".join(str(entry.get(field) or "").lower().split()) for field in key_fields)
+
+def merge_partial_profiles(partials):
+    # reduce step, deterministic in chunk order: scalars keep the first non-empty value, additionalInfo
+    # joins the distinct ones, list entries are deduplicated on MERGE_KEYS and a repeated entry (a job
+    # split across two chunks) fills the blanks and extends the lists of the first one
+    merged, seen, extra = {}, {field: {} for field in MERGE_KEYS}, []
+    for partial in partials:
+        for field, value in partial.items():
+            if field in MERGE_KEYS:
+                entries = merged.setdefault(field, [])
+                for entry in value if isinstance(value, list) else []:
+                    key = _entry_key(entry, MERGE_KEYS[field])
+                    existing = seen[field].get(key)
+                    if existing is None:
+                        entry = dict(entry) if isinstance(entry, dict) else entry
+                        seen[field][key] = entry
+                        entries.append(entry)
+                    elif isinstance(existing, dict) and isinstance(entry, dict):
+                        for name, item in entry.items():
+                            if isinstance(existing.get(name), list) and isinstance(item, list):
+                                existing[name] = existing[name] + [line for line in item if line not in existing[name]]
+                            elif not existing.get(name):
+                                existing[name] = item
+            elif field == "additionalInfo":
+                if value and value not in extra:
+                    extra.append(value)
+            elif not merged.get(field):
+                merged[field] = value
+    if extra:
+        merged["additionalInfo"] = "\n".join(extra)
+    return merged
+
+class StreamingJsonParser:
+    # single pass over model output that can be fed in chunks (the agents currently hand it whole responses):
+    # anything before the first "{" (prose, a ``` fence) is skipped, commas followed by a closing bracket are
+    # dropped, and everything after the top-level object closes is ignored. result() also accepts output
+    # that was cut off, closing what is still open
+    def __init__(self):
+        self.chars = []
+        self.stack = []
+        self.safe_points = []
+        self.in_string = self.escaped = False
+        self.started = self.done = False
+        self.pending_comma = False
+
+    def _flush_comma(self):
+        if self.pending_comma:
+            # everything up to here is complete elements, a fallback point if the output is cut off later
+            self.safe_points.append((len(self.chars), tuple(self.stack)))
+            self.chars.append(",")
+            self.pending_comma = False
+
+    def feed(self, chunk):
+        for char in chunk:
+            if self.done:
+                return
+            if not self.started:
+                if char == "{":
+                    self.started = True
+                    self.stack.append("}")
+                    self.chars.append(char)
+                    self.safe_points.append((len(self.chars), tuple(self.stack)))
+                continue
+            if self.in_string:
+                self.chars.append(char)
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char.isspace():
+                if not self.pending_comma:
+                    self.chars.append(char)
+            elif char == ",":
+                self.pending_comma = True
+            elif char in "}]":
+                self.pending_comma = False
+                if self.stack and char == self.stack[-1]:
+                    self.stack.pop()
+                    self.chars.append(char)
+                    self.done = not self.stack
+            else:
+                self._flush_comma()
+                self.chars.append(char)
+                if char == '"':
+                    self.in_string = True
+                elif char in "{[":
+                    self.stack.append("}" if char == "{" else "]")
+                    self.safe_points.append((len(self.chars), tuple(self.stack)))
+
+    def result(self):
+        # returns (parsed object, whether the output was complete)
+        if not self.started:
+            raise json.JSONDecodeError("no JSON object in model output", "", 0)
+        text = "".join(self.chars)
+        if self.done:
+            return json.loads(text), True
+        if self.in_string:
+            text = (text[:-1] if self.escaped else text) + '"'
+        # close what is open, else fall back to the last point where every element was complete
+        candidates = [(text, tuple(self.stack))] + [(text[:length], stack) for length, stack in reversed(self.safe_points)]
+        for candidate, stack in candidates:
+            try:
+                return json.loads(candidate + "".join(reversed(stack))), False
+            except json.JSONDecodeError:
+                continue
+        return {}, False
+
+def conform_to_schema(value, shape):
+    # value reshaped to a RESUME_SCHEMA shape, or None when it cannot be: entries of a list of objects
+    # must be objects (a bare "Python" becomes {"name": "Python"} for one-field entries), unknown keys are
+    # dropped, numbers become strings, a string stands in for a one-item list of strings and a list of
+    # strings is joined where a single string is expected. Empty entries are left out
+    if isinstance(shape, dict):
+        if isinstance(value, str) and value.strip() and len(shape) == 1:
+            value = {next(iter(shape)): value}
+        if not isinstance(value, dict):
+            return None
+        entry = {}
+        for key, item_shape in shape.items():
+            item = conform_to_schema(value[key], item_shape) if key in value else None
+            if item is not None:
+                entry[key] = item
+        return entry
+    if isinstance(shape, list):
+        item_shape = shape[0] if shape else ""
+        if isinstance(value, str) and not isinstance(item_shape, dict):
+            value = [value] if value else []
+        if not isinstance(value, list):
+            return None
+        items = [conform_to_schema(item, item_shape) for item in value]
+        return [item for item in items if item not in (None, {})]
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return " ".join(value)
+    return None
+
+def parse_agent_output(raw_output, agent_input):
+    # returns (fields that came back intact, requested fields still missing). A field of the wrong
+    # top-level type counts as missing, list entries are conformed to the schema. The last field of a
+    # truncated answer is counted as missing since it may have been cut short
+    parser = StreamingJsonParser()
+    parser.feed(raw_output)
+    parsed, complete = parser.result()
+    fields = list(json.loads(agent_input["schema"]))
+    parsed = {
+        field: conform_to_schema(value, RESUME_SCHEMA[field]) for field, value in parsed.items()
+        if field in fields and isinstance(value, type(RESUME_SCHEMA[field]))
+    }
+    if not complete and parsed:
+        last = list(parsed)[-1]
+        if isinstance(parsed[last], str):
+            del parsed[last]
+        missing = [field for field in fields if field not in parsed] + ([last] if last in parsed else [])
+    else:
+        missing = [field for field in fields if field not in parsed]
+    return parsed, missing
+
+def continuation_input(agent_input, fields):
+    # the same resume text, asking only for the given fields. A fresh request rather than a continuation
+    # of the cut-off answer, since the tools agent does not take a partial assistant message to extend
+    return {"input": agent_input["input"], "schema": json.dumps({field: RESUME_SCHEMA[field] for field in fields}, indent=2)}
+
+def _extract(agent, agent_input, continuations=1):
+    # returns (merged profile fields, fields still missing after the follow-up requests)
+    parsed, missing = parse_agent_output(agent.invoke(agent_input).get('output', ''), agent_input)
+    partials = [parsed]
+    for _ in range(continuations):
+        if not missing:
+            break
+        follow_up = continuation_input(agent_input, missing)
+        parsed, missing = parse_agent_output(agent.invoke(follow_up).get('output', ''), follow_up)
+        partials.append(parsed)
+    return merge_partial_profiles(partials), missing
+
+def merge_resume_fields(prefilled, llm_json, links):
+    # prefilled only holds what the patterns found, the model's value is kept for everything else
+    merged = {**llm_json, **{field: value for field, value in prefilled.items() if value}}
+    # a project without a link gets the first URL found in the resume that contains its name
+    for project in merged.get("projects") or []:
+        if isinstance(project, dict) and not project.get("link"):
+            slug = re.sub(r"[^a-z0-9]", "", str(project.get("name", "")).lower())
+            project["link"] = next((link for link in links if slug and slug in re.sub(r"[^a-z0-9]", "", link.lower())), "")
+    return merged
+
+def report_prompt_savings(pdf_paths):
+    # prompt size with the full schema and resume against the reduced request(s)
+    full_prompt = RESUME_SYSTEM_PROMPT.replace("{schema}", json.dumps(RESUME_SCHEMA, indent=2))
+    total_full = total_reduced = 0
+    for pdf_path in pdf_paths:
+        text = get_text_from_pdf(pdf_path)
+        _, _, agent_inputs = build_resume_request(text)
+        full = count_tokens(full_prompt) + count_tokens(text)
+        reduced = sum(request_tokens(agent_input) for agent_input in agent_inputs)
+        total_full, total_reduced = total_full + full, total_reduced + reduced
+        print(f"{os.path.basename(pdf_path)}: ~{full} -> ~{reduced} prompt tokens in {len(agent_inputs)} request(s)")
+    if total_full:
+        print(f"Total: ~{total_full} -> ~{total_reduced} prompt tokens ({1 - total_reduced / total_full:.0%} fewer)")
+
+def resume_extractor(agent=None):
+    # (backend, model name) of the agent that parses a resume, no agent means the default OpenAI one
+    if isinstance(agent, LocalResumeAgent):
+        return agent.backend, agent.model_name
+    return "openai", OPENAI_RESUME_MODEL
+
+def resume_cache_key(pdf_path, backend="openai", model_name=OPENAI_RESUME_MODEL):
+    # different backends and models give different output, so they never share cache entries
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(f"\nschema:{RESUME_SCHEMA_VERSION}\nprompt:{RESUME_SYSTEM_PROMPT}\nbackend:{backend}\nmodel:{model_name}".encode("utf-8"))
+    return digest.hexdigest()
+
+def load_cached_resume(cache_dir, key):
+    # the raw LLM JSON from an earlier parse of the same PDF bytes, or None
+    if not cache_dir:
+        return None
+    try:
+        with open(os.path.join(cache_dir, f"{key}.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_cached_resume(cache_dir, key, parsed_json):
+    if not cache_dir:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{key}.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(parsed_json, f)
+    os.replace(tmp_path, path)
+
+def parse_student_resume(pdf_path, agent=None, cache_dir="./.resume_cache", pdf_backend="pypdf2"):
+    # repeat uploads of the same PDF are served from the cache without extraction or an LLM call
+    key = resume_cache_key(pdf_path, *resume_extractor(agent))
+    parsed_json = load_cached_resume(cache_dir, key)
+    if parsed_json is None:
+        text = get_text_from_pdf(pdf_path, backend=pdf_backend)
+        prefilled, links, agent_inputs = build_resume_request(text)
+        agent = agent or create_student_resume_agent()
+        # chunks of a long resume are extracted concurrently (one at a time locally), then merged in document order
+        with ThreadPoolExecutor(max_workers=min(len(agent_inputs), getattr(agent, "max_concurrency", len(agent_inputs)))) as pool:
+            results = list(pool.map(lambda agent_input: _extract(agent, agent_input), agent_inputs))
+        parsed_json = merge_resume_fields(prefilled, merge_partial_profiles([partial for partial, _ in results]), links)
+        missing = sorted({field for _, fields in results for field in fields})
+        # an incomplete profile is returned but not cached, so the next upload tries again
+        if missing:
+            print(f"{os.path.basename(pdf_path)}: {', '.join(missing)} still missing, not caching")
+        else:
+            save_cached_resume(cache_dir, key, parsed_json)
     final_profile = ensure_profile_shape(parsed_json)
     return final_profile
 
+# errors worth another attempt: throttling, dropped connections, server faults and output with no JSON at all
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError, json.JSONDecodeError)
+
+class TokenBucket:
+    # refills rate units per second up to capacity, acquire waits until amount units are available
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        # the lock is held while waiting so callers are served in arrival order
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+async def _invoke_with_retries(agent, agent_input, request_bucket, token_bucket, retries, base_delay, label):
+    for attempt in range(retries + 1):
+        await request_bucket.acquire()
+        if token_bucket is not None:
+            # prompt plus room for the JSON answer
+            await token_bucket.acquire(request_tokens(agent_input) + 1000)
+        try:
+            result = await agent.ainvoke(agent_input)
+            return parse_agent_output(result.get('output', ''), agent_input)
+        except RETRYABLE_ERRORS as e:
+            if attempt == retries:
+                raise
+            # exponential backoff with jitter so throttled workers do not retry in lockstep
+            delay = base_delay * 2 ** attempt * (1 + random.random())
+            print(f"{label}: {type(e).__name__}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def _extract_async(agent, agent_input, request_bucket, token_bucket, retries, base_delay, label, continuations=1):
+    parsed, missing = await _invoke_with_retries(agent, agent_input, request_bucket, token_bucket, retries, base_delay, label)
+    partials = [parsed]
+    for _ in range(continuations):
+        if not missing:
+            break
+        print(f"{label}: requesting {', '.join(missing)} again")
+        follow_up = continuation_input(agent_input, missing)
+        parsed, missing = await _invoke_with_retries(agent, follow_up, request_bucket, token_bucket, retries, base_delay, label)
+        partials.append(parsed)
+    return merge_partial_profiles(partials), missing
+
+async def parse_student_resume_async(pdf_path, agent, request_bucket, token_bucket=None, retries=5, base_delay=1.0, cache_dir="./.resume_cache", pdf_backend="pypdf2"):
+    key = await asyncio.to_thread(resume_cache_key, pdf_path, *resume_extractor(agent))
+    parsed_json = load_cached_resume(cache_dir, key)
+    if parsed_json is not None:
+        return ensure_profile_shape(parsed_json)
+
+    text = await asyncio.to_thread(get_text_from_pdf, pdf_path, None, pdf_backend)
+    prefilled, links, agent_inputs = build_resume_request(text)
+    results = await asyncio.gather(*(
+        _extract_async(agent, agent_input, request_bucket, token_bucket, retries, base_delay, os.path.basename(pdf_path))
+        for agent_input in agent_inputs
+    ))
+    parsed_json = merge_resume_fields(prefilled, merge_partial_profiles([partial for partial, _ in results]), links)
+    missing = sorted({field for _, fields in results for field in fields})
+    # an incomplete profile is returned but not cached, so the next run tries again
+    if missing:
+        print(f"{os.path.basename(pdf_path)}: {', '.join(missing)} still missing, not caching")
+    else:
+        save_cached_resume(cache_dir, key, parsed_json)
+    return ensure_profile_shape(parsed_json)
+
+def completed_files(output_path):
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    valid_bytes = 0
+    with open(output_path, "rb") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["file"])
+            except (json.JSONDecodeError, KeyError):
+                break
+            if not line.endswith(b"\n"):
+                break
+            valid_bytes += len(line)
+    # drop a line cut off by a crash so new results are not appended onto it
+    with open(output_path, "r+b") as f:
+        f.truncate(valid_bytes)
+    return done
+
+async def ingest_resumes(pdf_dir, output_path, concurrency=8, requests_per_minute=60, tokens_per_minute=None, retries=5, base_url=None, cache_dir="./.resume_cache", backend="openai", pdf_backend="pypdf2"):
+    # one client and agent serve every resume; finished files are appended to output_path as
+    # {"file": ..., "profile": ...} lines and skipped on the next run, failed ones are retried then
+    pdf_paths = sorted(glob.glob(os.path.join(pdf_dir, "*.pdf")))
+    done = completed_files(output_path)
+    pending = [path for path in pdf_paths if os.path.basename(path) not in done]
+    print(f"{len(done)} of {len(pdf_paths)} resumes already ingested, {len(pending)} to go")
+
+    agent = create_student_resume_agent(base_url, max_retries=0, backend=backend)
+    if concurrency > getattr(agent, "max_concurrency", concurrency):
+        print(f"The {backend} backend decodes one resume at a time, running with concurrency {agent.max_concurrency} instead of {concurrency}")
+        concurrency = agent.max_concurrency
+    semaphore = asyncio.Semaphore(concurrency)
+    request_bucket = TokenBucket(requests_per_minute / 60, capacity=max(1, concurrency))
+    token_bucket = TokenBucket(tokens_per_minute / 60, capacity=tokens_per_minute) if tokens_per_minute else None
+    failed = []
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        async def ingest(pdf_path):
+            async with semaphore:
+                try:
+                    profile = await parse_student_resume_async(pdf_path, agent, request_bucket, token_bucket, retries, cache_dir=cache_dir, pdf_backend=pdf_backend)
+                except Exception as e:
+                    failed.append(pdf_path)
+                    print(f"{os.path.basename(pdf_path)}: failed ({type(e).__name__}: {e})")
+                    return
+            out.write(json.dumps({"file": os.path.basename(pdf_path), "profile": profile}) + "\n")
+            out.flush()
+
+        await asyncio.gather(*(ingest(pdf_path) for pdf_path in pending))
+
+    elapsed = time.perf_counter() - start
+    succeeded = len(pending) - len(failed)
+    print(f"Ingested {succeeded} resumes in {elapsed:.1f}s ({succeeded / max(elapsed, 1e-9) * 60:.1f}/min), {len(failed)} failed")
+    return failed
+
 if __name__ == "__main__":
-    result = parse_student_resume("PDF_parser_resume.pdf")
-    print(json.dumps(result, indent=2))
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--benchmark", action="store_true", help="time PDF text extraction against the original serial loop and exit")
+    arg_parser.add_argument("--benchmark-normalize", action="store_true", help="time batch profile normalization and exit")
+    arg_parser.add_argument("--prompt-stats", action="store_true", help="print estimated prompt tokens with and without local pre-extraction and exit")
+    arg_parser.add_argument("--bulk-dir", default=None, help="ingest every PDF in this directory instead of the sample resume")
+    arg_parser.add_argument("--output", default="profiles.jsonl", help="with --bulk-dir, appended to as resumes finish, finished files are skipped on restart")
+    arg_parser.add_argument("--concurrency", type=int, default=8, help="resumes in flight at once, always 1 with --backend local")
+    arg_parser.add_argument("--requests-per-minute", type=float, default=60)
+    arg_parser.add_argument("--tokens-per-minute", type=float, default=None, help="estimated prompt + completion tokens allowed per minute")
+    arg_parser.add_argument("--retries", type=int, default=5)
+    arg_parser.add_argument("--cache-dir", default="./.resume_cache", help="raw LLM output keyed by PDF hash, prompt version, backend and model, empty string disables it")
+    arg_parser.add_argument("--backend", choices=["openai", "local"], default="openai", help="local extracts with the fine-tuned model in ./model-finetuned-rtx4050")
+    arg_parser.add_argument("--pdf-backend", choices=["pypdf2", "pymupdf"], default="pypdf2", help="pymupdf is faster on long PDFs but needs PyMuPDF installed")
+    arg_parser.add_argument("--base-url", default=None, help="OpenAI-compatible endpoint, defaults to OPENAI_BASE_URL or the OpenAI API")
+    args = arg_parser.parse_args()
+
+    if args.benchmark:
+        benchmark_extraction()
+    elif args.benchmark_normalize:
+        benchmark_normalization()
+    elif args.prompt_stats:
+        report_prompt_savings(sorted(glob.glob(os.path.join(args.bulk_dir, "*.pdf"))) if args.bulk_dir else ["PDF_parser_resume.pdf"])
+    elif args.bulk_dir:
+        asyncio.run(ingest_resumes(args.bulk_dir, args.output, args.concurrency, args.requests_per_minute, args.tokens_per_minute, args.retries, args.base_url, args.cache_dir, args.backend, args.pdf_backend))
+    else:
+        result = parse_student_resume("PDF_parser_resume.pdf", create_student_resume_agent(args.base_url, backend=args.backend), args.cache_dir, args.pdf_backend)
+        print(json.dumps(result, indent=2))
\ No newline at end of file
@@ -7,14 +7,26 @@ import numpy as np
 import os
 import glob
 import pandas as pd
-from torch.utils.data import DataLoader, random_split
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, random_split, Subset
+from torch.utils.data.distributed import DistributedSampler
 import random
+import argparse
+import math
+import time
+import copy
+from train_profiler import StepProfiler
 
 class CREMADDataset(torch.utils.data.Dataset):
-    def __init__(self, data_dir="./data"):
+    def __init__(self, data_dir="./data", variable_length=False, max_samples=None):
         self.data_dir = data_dir
+        self.variable_length = variable_length
+        self.max_samples = max_samples
         self.file_paths = []
         self.emotion_labels = []
+        self._num_samples = None
         self._load_file_paths()
         self.labels = sorted(list(set(self.emotion_labels)))
         self.label_to_idx = {label: idx for idx, label in enumerate(self.labels)}
@@ -42,11 +54,21 @@ class CREMADDataset(torch.utils.data.Dataset):
                 self.file_paths.append(audio_path)
                 self.emotion_labels.append(emotion)
     
+    def num_samples(self):
+        # clip lengths at 16kHz read from the file headers, used for bucketing without decoding audio
+        if self._num_samples is None:
+            self._num_samples = [int(round(librosa.get_duration(path=path) * 16000)) for path in self.file_paths]
+        return self._num_samples
+    
     def __getitem__(self, idx):
         waveform, _ = librosa.load(self.file_paths[idx], sr=16000, mono=True)
         waveform = torch.from_numpy(waveform).float().squeeze()
         
-        if waveform.shape[0] > 16000:
+        if self.variable_length:
+            if self.max_samples and waveform.shape[0] > self.max_samples:
+                start_idx = random.randint(0, waveform.shape[0] - self.max_samples)
+                waveform = waveform[start_idx:start_idx + self.max_samples]
+        elif waveform.shape[0] > 16000:
             start_idx = random.randint(0, waveform.shape[0] - 16000)
             waveform = waveform[start_idx:start_idx + 16000]
         else:
@@ -56,14 +78,60 @@ class CREMADDataset(torch.utils.data.Dataset):
     
     def __len__(self):
         return len(self.file_paths)
+
+def collate_variable_length(batch):
+    waveforms, targets = zip(*batch)
+    lengths = torch.tensor([waveform.shape[0] for waveform in waveforms], dtype=torch.long)
+    return nn.utils.rnn.pad_sequence(waveforms, batch_first=True), lengths, torch.stack(targets)
+
+class LengthBucketSampler(torch.utils.data.Sampler):
+    def __init__(self, lengths, batch_size, shuffle=True, seed=0, num_replicas=1, rank=0, bucket_batches=50):
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.bucket_batches = bucket_batches
+        self.epoch = 0
+    
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+    
+    def __iter__(self):
+        if self.shuffle:
+            generator = torch.Generator().manual_seed(self.seed + self.epoch)
+            order = torch.randperm(len(self.lengths), generator=generator).tolist()
+            # sort inside random pools of clips so batches are length-homogeneous but still vary per epoch
+            pool_size = self.batch_size * self.bucket_batches
+            batches = []
+            for start in range(0, len(order), pool_size):
+                pool = sorted(order[start:start + pool_size], key=lambda idx: self.lengths[idx])
+                batches.extend(pool[i:i + self.batch_size] for i in range(0, len(pool), self.batch_size))
+            batches = [batches[i] for i in torch.randperm(len(batches), generator=generator).tolist()]
+        else:
+            order = sorted(range(len(self.lengths)), key=lambda idx: self.lengths[idx])
+            batches = [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+        
+        # every rank must run the same number of steps, so wrap around to fill the last round
+        total = len(self) * self.num_replicas
+        batches += batches[:total - len(batches)]
+        return iter(batches[self.rank:total:self.num_replicas])
+    
+    def __len__(self):
+        return math.ceil(math.ceil(len(self.lengths) / self.batch_size) / self.num_replicas)
     
 class AttentionPooling(nn.Module):
     def __init__(self, input_dim):
         super().__init__()
         self.attention = nn.Linear(input_dim, 1)
         
-    def forward(self, x):
-        weights = torch.softmax(self.attention(x), dim=1)
+    def forward(self, x, lengths=None):
+        scores = self.attention(x)
+        if lengths is not None:
+            padding = torch.arange(x.shape[1], device=x.device)[None, :] >= lengths[:, None]
+            scores = scores.masked_fill(padding.unsqueeze(-1), float("-inf"))
+        weights = torch.softmax(scores, dim=1)
         return torch.sum(x * weights, dim=1)
 
 class audioModel(nn.Module):
@@ -90,241 +158,297 @@ class audioModel(nn.Module):
         )
         self.pooling = AttentionPooling(3072)
         
-    def forward(self, x):
-        features, _ = self.wavModel.extract_features(x)
+    def forward(self, x, lengths=None):
+        features, lengths = self.wavModel.extract_features(x, lengths)
         features = torch.cat([features[-4], features[-3], features[-2], features[-1]], dim=-1)
-        features = self.pooling(features)
+        features = self.pooling(features, lengths)
         return self.classifier(features)
 
-def train_epoch(model, loader, optimizer, criterion, device):
-    model.train()
-    total_loss = correct = total = 0
-    
-    for waveform, targets in loader:
-        waveform, targets = waveform.to(device), targets.to(device)
-        optimizer.zero_grad()
-        outputs = model(waveform)
-        loss = criterion(outputs, targets)
-        loss.backward()
-        optimizer.step()
-        total_loss += loss.item()
-        _, predicted = torch.max(outputs.data, 1)
-        total += targets.size(0)
-        correct += (predicted == targets).sum().item()
-    
-    return total_loss / len(loader), 100 * correct / total
-
-def validate_epoch(model, loader, criterion, device):
-    model.eval()
-    total_loss = correct = total = 0
-    
-    with torch.no_grad():
-        for waveform, targets in loader:
-            waveform, targets = waveform.to(device), targets.to(device)
-            outputs = model(waveform)
-            loss = criterion(outputs, targets)
-            total_loss += loss.item()
-            _, predicted = torch.max(outputs.data, 1)
-            total += targets.size(0)
-            correct += (predicted == targets).sum().item()
-    
-    return total_loss / len(loader), 100 * correct / total
-
-def main():
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    dataset = CREMADDataset(data_dir="./data")
-    
-    train_size = int(0.8 * len(dataset))
-    train_dataset, val_dataset = random_split(dataset, [train_size, len(dataset) - train_size])
-    train_loader = DataLoader(train_dataset, batch_size=8, shuffle=True, num_workers=0)
-    val_loader = DataLoader(val_dataset, batch_size=8, shuffle=False, num_workers=0)
-    
-    model = audioModel(len(dataset.labels)).to(device)
-    optimizer = optim.Adam(model.parameters(), lr=0.0001)
-    criterion = nn.CrossEntropyLoss()
-    
-    for epoch in range(30):
-        train_loss, train_acc = train_epoch(model, train_loader, optimizer, criterion, device)
-        val_loss, val_acc = validate_epoch(model, val_loader, criterion, device)
-        print(f"Epoch {epoch+1}: Train Acc {train_acc:.2f}%, Val Acc {val_acc:.2f}%")
-    
-    torch.save(model.state_dict(), "cremad_emotion_model.pth")
-    torch.save(dataset.labels, "emotion_labels.pth")
-
-def predict_audio(model, audio_path, labels, device):
-    model.eval()
-    waveform, _ = librosa.load(audio_path, sr=16000, mono=True)
-    waveform = torch.from_numpy(waveform).float().squeeze()
-    
-    if waveform.shape[0] > 16000:
-        start_idx = random.randint(0, waveform.shape[0] - 16000)
-        waveform = waveform[start_idx:start_idx + 16000]
-    else:
-        waveform = torch.nn.functional.pad(waveform, (0, 16000 - waveform.shape[0]))
-    
-    with torch.no_grad():
-        waveform = waveform.unsqueeze(0).to(device)
-        outputs = model(waveform)
-        predicted_idx = torch.argmax(outputs, dim=1).item()
-        confidence = torch.softmax(outputs, dim=1).max().item()
-    
-    return {"predicted_emotion": labels[predicted_idx], "confidence": confidence}
-
-if __name__ == "__main__":
-    main()
-import torch
-import torch.nn as nn
-import torch.optim as optim
-import torchaudio
-import librosa
-import numpy as np
-import os
-import glob
-import pandas as pd
-from torch.utils.data import DataLoader, random_split
-import random
-
-class CREMADDataset(torch.utils.data.Dataset):
-    def __init__(self, data_dir="./data"):
-        self.data_dir = data_dir
-        self.file_paths = []
-        self.emotion_labels = []
-        self._load_file_paths()
-        self.labels = sorted(list(set(self.emotion_labels)))
-        self.label_to_idx = {label: idx for idx, label in enumerate(self.labels)}
-        
-    def _load_file_paths(self):
-        csv_path = os.path.join(self.data_dir, "processedResults", "tabulatedVotes.csv")
-        if not os.path.exists(csv_path):
-            csv_path = os.path.join(self.data_dir, "tabulatedVotes.csv")
-        audio_dir = os.path.join(self.data_dir, "AudioWAV")
-        
-        df = pd.read_csv(csv_path)
-        if 'fileName' not in df.columns and df.columns[0] == '':
-            df = df.rename(columns={'': 'fileName'})
-        
-        for _, row in df.iterrows():
-            filename = row['fileName'] 
-            filename += ".wav"
-            audio_path = os.path.join(audio_dir, filename)
-            audio_path = audio_path.replace("\\", "/")
-
-            if os.path.exists(audio_path):
-                emotion_counts = {k: row.get(k, 0) for k in ['A', 'D', 'F', 'H', 'N', 'S']}
-                max_emotion_code = max(emotion_counts, key=emotion_counts.get)
-                emotion = {'A': 'angry', 'D': 'disgust', 'F': 'fear', 'H': 'happy', 'N': 'neutral', 'S': 'sad'}.get(max_emotion_code)
-                self.file_paths.append(audio_path)
-                self.emotion_labels.append(emotion)
-    
-    def __getitem__(self, idx):
-        waveform, _ = librosa.load(self.file_paths[idx], sr=16000, mono=True)
-        waveform = torch.from_numpy(waveform).float().squeeze()
-        
-        if waveform.shape[0] > 16000:
-            start_idx = random.randint(0, waveform.shape[0] - 16000)
-            waveform = waveform[start_idx:start_idx + 16000]
-        else:
-            waveform = torch.nn.functional.pad(waveform, (0, 16000 - waveform.shape[0]))
-        
-        return waveform, torch.tensor(self.label_to_idx[self.emotion_labels[idx]], dtype=torch.long)
-    
-    def __len__(self):
-        return len(self.file_paths)
-    
-class AttentionPooling(nn.Module):
-    def __init__(self, input_dim):
-        super().__init__()
-        self.attention = nn.Linear(input_dim, 1)
-        
-    def forward(self, x):
-        weights = torch.softmax(self.attention(x), dim=1)
-        return torch.sum(x * weights, dim=1)
-
-class audioModel(nn.Module):
-    def __init__(self, num_classes):
+class studentAudioModel(nn.Module):
+    def __init__(self, num_classes, num_layers=4):
         super().__init__()
+        # keep only the lowest pretrained transformer layers and pool the last one, 768 instead of 3072 features
         self.wavModel = torchaudio.pipelines.WAV2VEC2_BASE.get_model()
-        for i, layer in enumerate(self.wavModel.encoder.transformer.layers):
-            if i < 8: 
-                for param in layer.parameters():
-                    param.requires_grad = False
+        self.wavModel.encoder.transformer.layers = self.wavModel.encoder.transformer.layers[:num_layers]
         self.classifier = nn.Sequential(
-            nn.Linear(3072, 512),
-            nn.BatchNorm1d(512),
-            nn.ReLU(),
-            nn.Dropout(0.4),
-            nn.Linear(512, 256),
-            nn.BatchNorm1d(256),
-            nn.ReLU(),
-            nn.Dropout(0.3),
-            nn.Linear(256, 128),
+            nn.Linear(768, 128),
             nn.ReLU(),
             nn.Dropout(0.2),
             nn.Linear(128, num_classes)
         )
-        self.pooling = AttentionPooling(3072)
+        self.pooling = AttentionPooling(768)
         
-    def forward(self, x):
-        features, _ = self.wavModel.extract_features(x)
-        features = torch.cat([features[-4], features[-3], features[-2], features[-1]], dim=-1)
-        features = self.pooling(features)
+    def forward(self, x, lengths=None):
+        features, lengths = self.wavModel.extract_features(x, lengths)
+        features = self.pooling(features[-1], lengths)
         return self.classifier(features)
 
-def train_epoch(model, loader, optimizer, criterion, device):
+def load_emotion_checkpoint(path, num_classes, device):
+    # student checkpoints carry their layer count, teacher checkpoints are a bare state dict
+    state = torch.load(path, map_location=device)
+    if "student_layers" in state:
+        model = studentAudioModel(num_classes, state["student_layers"])
+        state = state["state_dict"]
+    else:
+        model = audioModel(num_classes)
+    model.load_state_dict(state)
+    return model.to(device).eval()
+
+def train_epoch(model, loader, optimizer, criterion, device, profiler=None):
     model.train()
+    profiler = profiler or StepProfiler()
     total_loss = correct = total = 0
     
-    for waveform, targets in loader:
-        waveform, targets = waveform.to(device), targets.to(device)
+    profiler.mark_data_start()
+    for *inputs, targets in loader:
+        profiler.begin_step()
+        inputs, targets = [tensor.to(device) for tensor in inputs], targets.to(device)
         optimizer.zero_grad()
-        outputs = model(waveform)
-        loss = criterion(outputs, targets)
-        loss.backward()
-        optimizer.step()
+        with profiler.phase("forward"):
+            outputs = model(*inputs)
+            loss = criterion(outputs, targets)
+        with profiler.phase("backward"):
+            loss.backward()
+        with profiler.phase("optimizer"):
+            optimizer.step()
+        profiler.end_step()
         total_loss += loss.item()
         _, predicted = torch.max(outputs.data, 1)
         total += targets.size(0)
         correct += (predicted == targets).sum().item()
     
-    return total_loss / len(loader), 100 * correct / total
+    return reduce_metrics(total_loss, len(loader), correct, total, device)
+
+def distill_epoch(model, teacher, loader, optimizer, criterion, device, temperature=2.0, alpha=0.7, profiler=None):
+    model.train()
+    teacher.eval()
+    profiler = profiler or StepProfiler()
+    total_loss = correct = total = 0
+    
+    profiler.mark_data_start()
+    for *inputs, targets in loader:
+        profiler.begin_step()
+        inputs, targets = [tensor.to(device) for tensor in inputs], targets.to(device)
+        optimizer.zero_grad()
+        with profiler.phase("forward"):
+            with torch.no_grad():
+                teacher_logits = teacher(*inputs)
+            outputs = model(*inputs)
+            soft_loss = nn.functional.kl_div(
+                nn.functional.log_softmax(outputs / temperature, dim=1),
+                nn.functional.softmax(teacher_logits / temperature, dim=1),
+                reduction="batchmean",
+            ) * temperature ** 2
+            loss = alpha * soft_loss + (1 - alpha) * criterion(outputs, targets)
+        with profiler.phase("backward"):
+            loss.backward()
+        with profiler.phase("optimizer"):
+            optimizer.step()
+        profiler.end_step()
+        total_loss += loss.item()
+        _, predicted = torch.max(outputs.data, 1)
+        total += targets.size(0)
+        correct += (predicted == targets).sum().item()
+    
+    return reduce_metrics(total_loss, len(loader), correct, total, device)
 
 def validate_epoch(model, loader, criterion, device):
     model.eval()
     total_loss = correct = total = 0
     
     with torch.no_grad():
-        for waveform, targets in loader:
-            waveform, targets = waveform.to(device), targets.to(device)
-            outputs = model(waveform)
+        for *inputs, targets in loader:
+            inputs, targets = [tensor.to(device) for tensor in inputs], targets.to(device)
+            outputs = model(*inputs)
             loss = criterion(outputs, targets)
             total_loss += loss.item()
             _, predicted = torch.max(outputs.data, 1)
             total += targets.size(0)
             correct += (predicted == targets).sum().item()
     
-    return total_loss / len(loader), 100 * correct / total
+    return reduce_metrics(total_loss, len(loader), correct, total, device)
+
+def reduce_metrics(total_loss, batches, correct, total, device):
+    # sum the raw counters over all ranks so every rank sees the global loss and accuracy
+    if dist.is_available() and dist.is_initialized():
+        counters = torch.tensor([total_loss, batches, correct, total], dtype=torch.float64, device=device)
+        dist.all_reduce(counters, op=dist.ReduceOp.SUM)
+        total_loss, batches, correct, total = counters.tolist()
+    return total_loss / max(batches, 1), 100 * correct / max(total, 1)
 
-def main():
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    dataset = CREMADDataset(data_dir="./data")
+def model_size_mb(model):
+    return sum(tensor.numel() * tensor.element_size() for tensor in model.state_dict().values()) / 2**20
+
+def cpu_latency_ms(model, num_samples=16000, runs=20):
+    model = copy.deepcopy(model).cpu().eval()
+    waveform = torch.randn(1, num_samples)
+    with torch.no_grad():
+        for _ in range(3):
+            model(waveform)
+        start = time.perf_counter()
+        for _ in range(runs):
+            model(waveform)
+    return (time.perf_counter() - start) / runs * 1000
+
+def report_distillation(teacher, student, val_loader, criterion, device, is_main=True):
+    # every rank validates its shard so the accuracies can be all-reduced, only rank 0 benchmarks and prints
+    _, teacher_acc = validate_epoch(teacher, val_loader, criterion, device)
+    _, student_acc = validate_epoch(student, val_loader, criterion, device)
+    if not is_main:
+        return
+    print(f"{'':8} {'size MB':>8} {'CPU ms/clip':>12} {'val acc':>8}")
+    for name, model, acc in [("teacher", teacher, teacher_acc), ("student", student, student_acc)]:
+        print(f"{name:8} {model_size_mb(model):8.1f} {cpu_latency_ms(model):12.1f} {acc:7.2f}%")
+
+def save_checkpoint(path, model, optimizer, epoch, best_val_acc, epochs_without_improvement):
+    state = {
+        "epoch": epoch,
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "best_val_acc": best_val_acc,
+        "epochs_without_improvement": epochs_without_improvement,
+        "python_rng": random.getstate(),
+        "numpy_rng": np.random.get_state(),
+        "torch_rng": torch.get_rng_state(),
+        "cuda_rng": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+    }
+    # write to a temp file first so a crash mid-save never leaves a corrupt checkpoint
+    tmp_path = path + ".tmp"
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path, model, optimizer, device):
+    state = torch.load(path, map_location=device, weights_only=False)
+    model.load_state_dict(state["model"])
+    optimizer.load_state_dict(state["optimizer"])
+    random.setstate(state["python_rng"])
+    np.random.set_state(state["numpy_rng"])
+    torch.set_rng_state(state["torch_rng"])
+    if state["cuda_rng"] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda_rng"])
+    return state["epoch"] + 1, state["best_val_acc"], state["epochs_without_improvement"]
+
+def main(epochs=30, checkpoint_dir="./checkpoints", checkpoint_every=1, resume=False, patience=5, min_delta=0.0, seed=42, variable_length=False, max_seconds=0.0, profile_dir=None, profile_start=5, profile_steps=20, distill=False, teacher_path="cremad_emotion_model.pth", student_layers=4, temperature=2.0, alpha=0.7, rank=0, world_size=1):
+    device = torch.device('cuda' if torch.cuda.is_available() and world_size == 1 else 'cpu')
+    is_main = rank == 0
+    random.seed(seed + rank)
+    np.random.seed(seed + rank)
+    torch.manual_seed(seed)
+    max_samples = int(max_seconds * 16000) or None
+    dataset = CREMADDataset(data_dir="./data", variable_length=variable_length, max_samples=max_samples)
     
+    # fixed split generator so a resumed run validates on the same clips
     train_size = int(0.8 * len(dataset))
-    train_dataset, val_dataset = random_split(dataset, [train_size, len(dataset) - train_size])
-    train_loader = DataLoader(train_dataset, batch_size=8, shuffle=True, num_workers=0)
-    val_loader = DataLoader(val_dataset, batch_size=8, shuffle=False, num_workers=0)
+    train_dataset, val_dataset = random_split(dataset, [train_size, len(dataset) - train_size], generator=torch.Generator().manual_seed(seed))
+    # strided shard instead of DistributedSampler so no clip is validated twice
+    val_dataset = Subset(dataset, val_dataset.indices[rank::world_size])
     
-    model = audioModel(len(dataset.labels)).to(device)
+    # fixed-length clips are padded or cut to one second, so only variable length needs the real durations
+    if variable_length:
+        clip_samples = [min(n, max_samples or n) for n in dataset.num_samples()]
+    else:
+        clip_samples = [16000] * len(dataset)
+    train_audio_seconds = sum(clip_samples[idx] for idx in train_dataset.indices) / 16000
+    if variable_length:
+        train_sampler = LengthBucketSampler([clip_samples[idx] for idx in train_dataset.indices], 8, shuffle=True, seed=seed, num_replicas=world_size, rank=rank)
+        train_loader = DataLoader(train_dataset, batch_sampler=train_sampler, collate_fn=collate_variable_length, num_workers=0)
+        val_sampler = LengthBucketSampler([clip_samples[idx] for idx in val_dataset.indices], 8, shuffle=False)
+        val_loader = DataLoader(val_dataset, batch_sampler=val_sampler, collate_fn=collate_variable_length, num_workers=0)
+    else:
+        if world_size > 1:
+            train_sampler = DistributedSampler(train_dataset, num_replicas=world_size, rank=rank, shuffle=True, seed=seed)
+            train_loader = DataLoader(train_dataset, batch_size=8, sampler=train_sampler, num_workers=0)
+        else:
+            train_sampler = None
+            train_loader = DataLoader(train_dataset, batch_size=8, shuffle=True, num_workers=0)
+        val_loader = DataLoader(val_dataset, batch_size=8, shuffle=False, num_workers=0)
+    
+    if distill:
+        teacher = load_emotion_checkpoint(teacher_path, len(dataset.labels), device)
+        model = studentAudioModel(len(dataset.labels), student_layers).to(device)
+    else:
+        model = audioModel(len(dataset.labels)).to(device)
     optimizer = optim.Adam(model.parameters(), lr=0.0001)
     criterion = nn.CrossEntropyLoss()
     
-    for epoch in range(30):
-        train_loss, train_acc = train_epoch(model, train_loader, optimizer, criterion, device)
-        val_loss, val_acc = validate_epoch(model, val_loader, criterion, device)
-        print(f"Epoch {epoch+1}: Train Acc {train_acc:.2f}%, Val Acc {val_acc:.2f}%")
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    prefix = "student_" if distill else ""
+    last_path = os.path.join(checkpoint_dir, f"{prefix}last.pth")
+    best_path = os.path.join(checkpoint_dir, f"{prefix}best_model.pth")
     
-    torch.save(model.state_dict(), "cremad_emotion_model.pth")
+    start_epoch, best_val_acc, epochs_without_improvement = 0, 0.0, 0
+    if resume and os.path.exists(last_path):
+        start_epoch, best_val_acc, epochs_without_improvement = load_checkpoint(last_path, model, optimizer, device)
+        if is_main:
+            print(f"Resuming from epoch {start_epoch + 1} (best val acc {best_val_acc:.2f}%)")
+    
+    train_model = DistributedDataParallel(model) if world_size > 1 else model
+    profiler = StepProfiler(profile_dir, profile_start, profile_steps, rank)
+    profiler.start()
+    
+    for epoch in range(start_epoch, epochs):
+        if train_sampler is not None:
+            train_sampler.set_epoch(epoch)
+        epoch_start = time.perf_counter()
+        if distill:
+            train_loss, train_acc = distill_epoch(train_model, teacher, train_loader, optimizer, criterion, device, temperature, alpha, profiler)
+        else:
+            train_loss, train_acc = train_epoch(train_model, train_loader, optimizer, criterion, device, profiler)
+        epoch_time = time.perf_counter() - epoch_start
+        val_loss, val_acc = validate_epoch(train_model, val_loader, criterion, device)
+        if is_main:
+            print(f"Epoch {epoch+1}: Train Acc {train_acc:.2f}%, Val Acc {val_acc:.2f}%, {train_audio_seconds / epoch_time:.1f} audio s/s")
+        
+        # metrics are all-reduced, so every rank takes the same early stopping decision
+        if val_acc > best_val_acc + min_delta:
+            best_val_acc = val_acc
+            epochs_without_improvement = 0
+            if is_main:
+                torch.save(model.state_dict(), best_path)
+        else:
+            epochs_without_improvement += 1
+        
+        stop = patience > 0 and epochs_without_improvement >= patience
+        if is_main and ((epoch + 1) % checkpoint_every == 0 or stop or epoch + 1 == epochs):
+            save_checkpoint(last_path, model, optimizer, epoch, best_val_acc, epochs_without_improvement)
+        if stop:
+            if is_main:
+                print(f"Early stopping: no val acc improvement in {patience} epochs")
+            break
+    
+    profiler.close()
+    if world_size > 1:
+        dist.barrier()
+    if os.path.exists(best_path):
+        model.load_state_dict(torch.load(best_path, map_location=device))
+    if distill:
+        report_distillation(teacher, model, val_loader, criterion, device, is_main)
+    if not is_main:
+        return
+    print(f"Best Val Acc {best_val_acc:.2f}%")
+    if distill:
+        torch.save({"student_layers": student_layers, "state_dict": model.state_dict()}, "cremad_emotion_student.pth")
+    else:
+        torch.save(model.state_dict(), "cremad_emotion_model.pth")
     torch.save(dataset.labels, "emotion_labels.pth")
 
+def distributed_worker(local_rank, nprocs, nnodes, node_rank, master_addr, master_port, train_kwargs):
+    rank = node_rank * nprocs + local_rank
+    world_size = nprocs * nnodes
+    # split the host's cores between local ranks instead of letting every rank oversubscribe them
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // nprocs))
+    dist.init_process_group("gloo", init_method=f"tcp://{master_addr}:{master_port}", rank=rank, world_size=world_size)
+    try:
+        main(rank=rank, world_size=world_size, **train_kwargs)
+    finally:
+        dist.destroy_process_group()
+
+def launch(nprocs=1, nnodes=1, node_rank=0, master_addr="127.0.0.1", master_port=29500, **train_kwargs):
+    if nprocs * nnodes == 1:
+        main(**train_kwargs)
+    else:
+        mp.spawn(distributed_worker, args=(nprocs, nnodes, node_rank, master_addr, master_port, train_kwargs), nprocs=nprocs, join=True)
+
 def predict_audio(model, audio_path, labels, device):
     model.eval()
     waveform, _ = librosa.load(audio_path, sr=16000, mono=True)
@@ -345,4 +469,28 @@ def predict_audio(model, audio_path, labels, device):
     return {"predicted_emotion": labels[predicted_idx], "confidence": confidence}
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--epochs", type=int, default=30)
+    arg_parser.add_argument("--checkpoint-dir", default="./checkpoints", help="must be on a shared filesystem when resuming across hosts")
+    arg_parser.add_argument("--checkpoint-every", type=int, default=1)
+    arg_parser.add_argument("--resume", action="store_true")
+    arg_parser.add_argument("--patience", type=int, default=5, help="epochs without val acc improvement before stopping, 0 disables")
+    arg_parser.add_argument("--min-delta", type=float, default=0.0)
+    arg_parser.add_argument("--seed", type=int, default=42)
+    arg_parser.add_argument("--variable-length", action="store_true", help="train on whole clips in length-bucketed batches")
+    arg_parser.add_argument("--max-seconds", type=float, default=0.0, help="crop variable-length clips longer than this, 0 keeps them whole")
+    arg_parser.add_argument("--profile-dir", default=None, help="write a Chrome trace and per-step timing summary here")
+    arg_parser.add_argument("--profile-start", type=int, default=5)
+    arg_parser.add_argument("--profile-steps", type=int, default=20)
+    arg_parser.add_argument("--distill", action="store_true", help="train a compact student on the soft labels of --teacher-path")
+    arg_parser.add_argument("--teacher-path", default="cremad_emotion_model.pth")
+    arg_parser.add_argument("--student-layers", type=int, default=4)
+    arg_parser.add_argument("--temperature", type=float, default=2.0)
+    arg_parser.add_argument("--alpha", type=float, default=0.7, help="weight of the soft-label loss against the hard-label loss")
+    arg_parser.add_argument("--nprocs", type=int, default=1, help="local training processes (gloo DDP when > 1)")
+    arg_parser.add_argument("--nnodes", type=int, default=1)
+    arg_parser.add_argument("--node-rank", type=int, default=0)
+    arg_parser.add_argument("--master-addr", default="127.0.0.1")
+    arg_parser.add_argument("--master-port", type=int, default=29500)
+    args = arg_parser.parse_args()
+    launch(**vars(args))
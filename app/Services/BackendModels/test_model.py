@@ -8,7 +8,7 @@ import numpy as np
 import os
 import subprocess
 from flask_cors import CORS
-from load_model import load_finetuned_model, generate_response
+from load_model import load_finetuned_model, generate_response, SemanticResponseCache
 from transformers import WhisperProcessor, WhisperForConditionalGeneration
 
 app = Flask(__name__)
@@ -19,6 +19,9 @@ emotion_model = None
 emotion_labels = None
 emotion_device = None
 
+# opt-in with SEMANTIC_CACHE=1: near-identical answers to the same question reuse earlier feedback
+response_cache = SemanticResponseCache(threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95"))) if os.environ.get("SEMANTIC_CACHE") == "1" else None
+
 class AttentionPooling(nn.Module):
     def __init__(self, input_dim):
         super().__init__()
@@ -50,6 +53,22 @@ class audioModel(nn.Module):
         features = self.pooling(features)
         return self.classifier(features)
 
+class studentAudioModel(nn.Module):
+    def __init__(self, num_classes, num_layers=4):
+        super().__init__()
+        self.wavModel = torchaudio.pipelines.WAV2VEC2_BASE.get_model()
+        self.wavModel.encoder.transformer.layers = self.wavModel.encoder.transformer.layers[:num_layers]
+        self.classifier = nn.Sequential(
+            nn.Linear(768, 128), nn.ReLU(), nn.Dropout(0.2),
+            nn.Linear(128, num_classes)
+        )
+        self.pooling = AttentionPooling(768)
+        
+    def forward(self, x):
+        features, _ = self.wavModel.extract_features(x)
+        features = self.pooling(features[-1])
+        return self.classifier(features)
+
 def convert_webm_to_wav(webm_path, wav_path):
     cmd = ['ffmpeg', '-i', webm_path, '-ar', '16000', '-ac', '1', '-y', wav_path]
     result = subprocess.run(cmd, capture_output=True, timeout=30)
@@ -57,10 +76,16 @@ def convert_webm_to_wav(webm_path, wav_path):
 
 def load_emotion_model():
     global emotion_model, emotion_labels, emotion_device
-    emotion_device = torch.device('cuda')
+    emotion_device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     emotion_labels = torch.load("emotion_labels.pth", map_location=emotion_device)
-    emotion_model = audioModel(len(emotion_labels)).to(emotion_device)
-    emotion_model.load_state_dict(torch.load("cremad_emotion_model.pth", map_location=emotion_device))
+    # EMOTION_MODEL_PATH=cremad_emotion_student.pth serves the distilled student from Voice.py --distill
+    state = torch.load(os.environ.get("EMOTION_MODEL_PATH", "cremad_emotion_model.pth"), map_location=emotion_device)
+    if "student_layers" in state:
+        emotion_model = studentAudioModel(len(emotion_labels), state["student_layers"]).to(emotion_device)
+        state = state["state_dict"]
+    else:
+        emotion_model = audioModel(len(emotion_labels)).to(emotion_device)
+    emotion_model.load_state_dict(state)
     emotion_model.eval()
 
 @app.route('/deepSeekAnswer', methods=['POST'])
@@ -78,10 +103,22 @@ DO NOT repeat the original question or answer verbatim.
 DO NOT explain your thought process or analysis method.
 Focus ONLY on constructive feedback and improvement suggestions."""
     
-    model, tokenizer = load_finetuned_model("./model-finetuned-rtx4050")
-    answer = generate_response(model, tokenizer, prompt)
+    def generate():
+        model, tokenizer = load_finetuned_model("./model-finetuned-rtx4050")
+        return generate_response(model, tokenizer, prompt)
+    
+    if response_cache is not None:
+        answer = response_cache.get_or_generate(data.get('question'), data.get('prompt'), generate)
+    else:
+        answer = generate()
     return jsonify({'answer': answer})
 
+@app.route('/cacheStats', methods=['GET'])
+def cache_stats():
+    if response_cache is None:
+        return jsonify({"error": "Semantic cache disabled"}), 404
+    return jsonify(response_cache.stats())
+
 @app.route('/predictVoice', methods=['POST'])
 def predict_emotion():
     if emotion_model is None:
@@ -1,8 +1,17 @@
+import re
+import time
+import threading
+import numpy as np
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList
 from peft import PeftModel, PeftConfig
 import os
 
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
 def load_finetuned_model(model_path):
     tokenizer = AutoTokenizer.from_pretrained(model_path)
     device_map = {"": 0}  
@@ -48,25 +57,194 @@ def load_finetuned_model(model_path):
                     )
     return model, tokenizer
 
-def generate_response(model, tokenizer, prompt, max_length=500, temperature=0.9):
-    device = next(model.parameters()).device
-    
-    inputs = tokenizer(prompt, return_tensors="pt")
-    inputs = {k: v.to(device) for k, v in inputs.items()}
-    
+THINK_CLOSE = "</think>"
+
+# "1.", "2)", "**3.**" or "### 3." at the start of a line opens a numbered feedback section
+SECTION_HEADING = re.compile(r"^([ \t#*]*)(\d+)[.)]", re.MULTILINE)
+
+class StopOnText(StoppingCriteria):
+    # stops once done(text) is true for the text generated after the first prompt_length tokens. The text is
+    # extended each step by decoding only the new tokens plus a few before them, not the whole generation
+    def __init__(self, tokenizer, prompt_length, done, context_tokens=4):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.done = done
+        self.context_tokens = context_tokens
+        self.text = ""
+        self.decoded = prompt_length
+
+    def __call__(self, input_ids, scores, **kwargs):
+        ids = input_ids[0]
+        start = max(self.prompt_length, self.decoded - self.context_tokens)
+        before = self.tokenizer.decode(ids[start:self.decoded], skip_special_tokens=True)
+        after = self.tokenizer.decode(ids[start:], skip_special_tokens=True)
+        # a character split over several tokens decodes to U+FFFD until its last token arrives
+        if not after.endswith("\ufffd"):
+            if after.startswith(before):
+                self.text += after[len(before):]
+            else:
+                self.text = self.tokenizer.decode(ids[self.prompt_length:], skip_special_tokens=True)
+            self.decoded = len(ids)
+        return torch.full((input_ids.shape[0],), self.done(self.text), dtype=torch.bool, device=input_ids.device)
+
+def cut_after_sections(text, num_sections=3):
+    # returns (text, complete). Top-level headings share the first heading's prefix (indent, "#", "**") and
+    # count up 1, 2, 3; anything else is a list inside a section. complete means heading num_sections + 1
+    # has started, and the text is cut before it. Otherwise the text comes back whole, so EOS or
+    # max_new_tokens ends the answer
+    prefix, expected = None, 1
+    for match in SECTION_HEADING.finditer(text):
+        if prefix is None and match.group(2) != "1":
+            continue
+        if prefix is None:
+            prefix = match.group(1)
+        elif match.group(1) == prefix and match.group(2) == "1":
+            # a sub-list numbered like the sections, headings can no longer be told apart from it
+            return text, False
+        if match.group(1) == prefix and int(match.group(2)) == expected:
+            if expected > num_sections:
+                return text[:match.start()], True
+            expected += 1
+    return text, False
+
+def _generate(model, inputs, max_new_tokens, temperature, stopping_criteria, pad_token_id):
     with torch.no_grad():
-        outputs = model.generate(
-            inputs["input_ids"],
-            max_length=max_length,
+        return model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
             temperature=temperature,
             do_sample=True,
             top_p=0.95,
             num_return_sequences=1,
+            stopping_criteria=StoppingCriteriaList([stopping_criteria]),
+            pad_token_id=pad_token_id,
         )
-    
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    
-    if response.startswith(prompt):
-        response = response[len(prompt):]
-    
-    return response.strip()
\ No newline at end of file
+
+def generate_response(model, tokenizer, prompt, max_new_tokens=400, temperature=0.9, think_budget=0, num_sections=3):
+    # R1-Distill reasons inside <think>...</think> before answering. think_budget caps that phase in tokens
+    # (0 skips it by closing the block right away), then the answer is generated with its own max_new_tokens
+    # and stopped once a section past the num_sections requested ones starts. Only the answer is returned.
+    device = next(model.parameters()).device
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+    if tokenizer.chat_template:
+        text = tokenizer.apply_chat_template([{"role": "user", "content": prompt}], tokenize=False, add_generation_prompt=True)
+    else:
+        text = (tokenizer.bos_token or "") + prompt + "\n"
+    # newer R1-Distill templates already open the reasoning block after the assistant tag
+    if not text.rstrip().endswith("<think>"):
+        text += "<think>\n"
+    # BOS is already part of the text
+    if think_budget > 0:
+        inputs = tokenizer(text, return_tensors="pt", add_special_tokens=False).to(device)
+        prompt_length = inputs["input_ids"].shape[1]
+        outputs = _generate(model, inputs, think_budget, temperature, StopOnText(tokenizer, prompt_length, lambda generated: THINK_CLOSE in generated), pad_token_id)
+        thoughts = tokenizer.decode(outputs[0, prompt_length:], skip_special_tokens=True)
+        # a reasoning phase that ran out of budget is closed for it
+        text += thoughts.split(THINK_CLOSE)[0].rstrip()
+    text += "\n" + THINK_CLOSE + "\n\n"
+
+    inputs = tokenizer(text, return_tensors="pt", add_special_tokens=False).to(device)
+    prompt_length = inputs["input_ids"].shape[1]
+    outputs = _generate(model, inputs, max_new_tokens, temperature, StopOnText(tokenizer, prompt_length, lambda generated: cut_after_sections(generated, num_sections)[1]), pad_token_id)
+
+    response = tokenizer.decode(outputs[0, prompt_length:], skip_special_tokens=True)
+    # the model sometimes opens a second reasoning block of its own, keep what follows it
+    response = response.split(THINK_CLOSE)[-1]
+    response, _ = cut_after_sections(response, num_sections)
+    return response.strip()
+
+class SemanticResponseCache:
+    # opt-in cache of generated feedback, partitioned by the exact question (case and spacing aside): a new
+    # answer to the same question whose embedding reaches threshold cosine similarity with a stored answer
+    # gets that answer's feedback back, feedback is never shared between different questions.
+    # At most max_entries are kept in memory, the least recently used one is replaced when full. Answers
+    # longer than the encoder reads (256 word pieces for MiniLM) bypass the cache, since two answers
+    # that only differ past the cut would embed the same
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2", threshold=0.95, max_entries=2048):
+        if SentenceTransformer is None:
+            raise ImportError("the semantic response cache needs sentence-transformers")
+        self.encoder = SentenceTransformer(model_name, device="cpu")
+        self.threshold = threshold
+        self.vectors = np.zeros((max_entries, self.encoder.get_sentence_embedding_dimension()), dtype=np.float32)
+        self.responses = [None] * max_entries
+        self.questions = [None] * max_entries
+        # normalized question -> rows holding answers to it
+        self.rows = {}
+        self.last_used = np.zeros(max_entries, dtype=np.int64)
+        self.size = 0
+        self.clock = 0
+        self.lock = threading.Lock()
+        self.lookups = self.hits = self.misses = self.skipped = 0
+        self.lookup_seconds = self.generate_seconds = 0.0
+
+    @staticmethod
+    def _question_key(question):
+        return " ".join(str(question or "").lower().split())
+
+    def _embed(self, answer):
+        # None when the answer does not fit in the encoder's input
+        answer = str(answer or "")
+        if len(self.encoder.tokenizer(answer)["input_ids"]) > self.encoder.max_seq_length:
+            return None
+        return self.encoder.encode(answer, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+    def get_or_generate(self, question, answer, generate):
+        # generate() is only called on a miss, its result is stored for later near-duplicates
+        start = time.perf_counter()
+        question_key = self._question_key(question)
+        vector = self._embed(answer)
+        if vector is None:
+            with self.lock:
+                self.lookups += 1
+                self.skipped += 1
+                self.lookup_seconds += time.perf_counter() - start
+            return generate()
+        with self.lock:
+            self.lookups += 1
+            self.clock += 1
+            rows = list(self.rows.get(question_key, ()))
+            if rows:
+                scores = self.vectors[rows] @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    self.last_used[rows[best]] = self.clock
+                    self.lookup_seconds += time.perf_counter() - start
+                    return self.responses[rows[best]]
+            self.lookup_seconds += time.perf_counter() - start
+
+        generate_start = time.perf_counter()
+        response = generate()
+        with self.lock:
+            self.misses += 1
+            self.generate_seconds += time.perf_counter() - generate_start
+            row = self.size if self.size < len(self.responses) else int(np.argmin(self.last_used))
+            self.size = max(self.size, row + 1)
+            if self.questions[row] is not None:
+                evicted = self.rows[self.questions[row]]
+                evicted.discard(row)
+                if not evicted:
+                    del self.rows[self.questions[row]]
+            self.rows.setdefault(question_key, set()).add(row)
+            self.questions[row] = question_key
+            self.vectors[row] = vector
+            self.responses[row] = response
+            self.last_used[row] = self.clock
+        return response
+
+    def stats(self):
+        with self.lock:
+            mean_generate = self.generate_seconds / self.misses if self.misses else 0.0
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "skipped_too_long": self.skipped,
+                "entries": self.size,
+                "questions": len(self.rows),
+                "mean_lookup_ms": self.lookup_seconds / self.lookups * 1000 if self.lookups else 0.0,
+                "mean_generate_s": mean_generate,
+                # a hit saves one average generation, every lookup costs its embedding and search
+                "saved_s": self.hits * mean_generate - self.lookup_seconds,
+            }
\ No newline at end of file
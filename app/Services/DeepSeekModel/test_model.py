@@ -6,7 +6,7 @@ import librosa
 import tempfile
 import os
 from flask_cors import CORS
-from load_model import load_finetuned_model, generate_response
+from load_model import load_finetuned_model, generate_response, SemanticResponseCache
 
 app = Flask(__name__)
 CORS(app)
@@ -16,6 +16,9 @@ emotion_model = None
 emotion_labels = None
 emotion_device = None
 
+# opt-in with SEMANTIC_CACHE=1: near-identical answers to the same question reuse earlier feedback
+response_cache = SemanticResponseCache(threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95"))) if os.environ.get("SEMANTIC_CACHE") == "1" else None
+
 class AttentionPooling(nn.Module):
     def __init__(self, input_dim):
         super().__init__()
@@ -92,11 +95,23 @@ def generate_text():
         Focus ONLY on constructive feedback and improvement suggestions.
         """
     model_path = "./model-finetuned-rtx4050"
-    model, tokenizer = load_finetuned_model(model_path)
-    answer = generate_response(model, tokenizer, prompt)
+    def generate():
+        model, tokenizer = load_finetuned_model(model_path)
+        return generate_response(model, tokenizer, prompt)
+
+    if response_cache is not None:
+        answer = response_cache.get_or_generate(question, data.get('prompt'), generate)
+    else:
+        answer = generate()
 
     return jsonify({'answer': answer})
 
+@app.route('/cacheStats', methods=['GET'])
+def cache_stats():
+    if response_cache is None:
+        return jsonify({"error": "Semantic cache disabled"}), 404
+    return jsonify(response_cache.stats())
+
 @app.route('/predict', methods=['POST'])
 def predict_emotion():
     try:
@@ -0,0 +1,80 @@
+import math
+import time
+import torch
+
+def _probe_step(model, batch_size, seq_len, vocab_size, device, dtype):
+    input_ids = torch.randint(0, vocab_size, (batch_size, seq_len), device=device)
+    with torch.autocast(device_type=device.type, dtype=dtype, enabled=dtype is not None):
+        loss = model(input_ids=input_ids, attention_mask=torch.ones_like(input_ids), labels=input_ids).loss
+    loss.backward()
+    model.zero_grad(set_to_none=True)
+
+def _fits_gpu(model, batch_size, seq_len, vocab_size, device, dtype, headroom):
+    torch.cuda.empty_cache()
+    torch.cuda.reset_peak_memory_stats(device)
+    try:
+        _probe_step(model, batch_size, seq_len, vocab_size, device, dtype)
+    except torch.cuda.OutOfMemoryError:
+        model.zero_grad(set_to_none=True)
+        torch.cuda.empty_cache()
+        return False
+    # leave room for optimizer state and allocator fragmentation that the probe does not see
+    total = torch.cuda.get_device_properties(device).total_memory
+    return torch.cuda.max_memory_allocated(device) <= headroom * total
+
+def _cpu_seconds_per_sample(model, batch_size, seq_len, vocab_size, device, dtype):
+    try:
+        start = time.perf_counter()
+        _probe_step(model, batch_size, seq_len, vocab_size, device, dtype)
+    except (MemoryError, RuntimeError):
+        model.zero_grad(set_to_none=True)
+        return None
+    return (time.perf_counter() - start) / batch_size
+
+def find_micro_batch_size(model, seq_len, max_batch_size=64, dtype=torch.bfloat16, headroom=0.9):
+    # on GPU: the largest power-of-two-bracketed batch whose forward+backward peak fits in memory;
+    # on CPU there is no OOM signal, so stop doubling once per-sample step time stops improving
+    device = next(model.parameters()).device
+    vocab_size = model.get_input_embeddings().num_embeddings
+    was_training = model.training
+    model.train()
+    # with reentrant gradient checkpointing the LoRA weights only get gradients if the inputs require them,
+    # Trainer sets this up too but only once training starts
+    if hasattr(model, "enable_input_require_grads"):
+        model.enable_input_require_grads()
+    try:
+        if device.type == "cuda":
+            low, high = 0, 1
+            while high <= max_batch_size and _fits_gpu(model, high, seq_len, vocab_size, device, dtype, headroom):
+                low, high = high, high * 2
+            high = min(high, max_batch_size + 1)
+            while high - low > 1:
+                middle = (low + high) // 2
+                if _fits_gpu(model, middle, seq_len, vocab_size, device, dtype, headroom):
+                    low = middle
+                else:
+                    high = middle
+            if low == 0:
+                raise RuntimeError(f"a single sequence of {seq_len} tokens does not fit in GPU memory")
+            return low
+
+        _cpu_seconds_per_sample(model, 1, seq_len, vocab_size, device, dtype)  # warm up kernels and allocator
+        best_size, best_time = 1, _cpu_seconds_per_sample(model, 1, seq_len, vocab_size, device, dtype)
+        size = 2
+        while size <= max_batch_size:
+            per_sample = _cpu_seconds_per_sample(model, size, seq_len, vocab_size, device, dtype)
+            if per_sample is None or per_sample > best_time * 0.9:
+                break
+            best_size, best_time = size, per_sample
+            size *= 2
+        return best_size
+    finally:
+        model.train(was_training)
+        if device.type == "cuda":
+            torch.cuda.empty_cache()
+
+def tune_batch_size(model, seq_len, target_batch_size, world_size=1, dtype=torch.bfloat16):
+    micro_batch = min(find_micro_batch_size(model, seq_len, max_batch_size=target_batch_size, dtype=dtype), target_batch_size)
+    accumulation = max(1, math.ceil(target_batch_size / (micro_batch * world_size)))
+    print(f"Auto batch: micro-batch {micro_batch} x accumulation {accumulation} x {world_size} device(s) = {micro_batch * accumulation * world_size} (target {target_batch_size})")
+    return micro_batch, accumulation
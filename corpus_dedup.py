@@ -0,0 +1,102 @@
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+from llm_data import read_text_chunks, file_sha256
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+def _permutations(num_perm, seed):
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+    return a, b
+
+def _update_signature(signature, shingles, a, b, block=4096):
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    # blocks of shingles keep the (shingles x num_perm) matrix small on long documents
+    for start in range(0, len(hashes), block):
+        permuted = ((hashes[start:start + block, None] * a + b) % _MERSENNE_PRIME) & _MAX_HASH
+        np.minimum(signature, permuted.min(axis=0), out=signature)
+
+def minhash_file(path, num_perm=128, shingle_size=5, seed=1):
+    # word shingles are streamed chunk by chunk, carrying the last shingle_size - 1 words across chunks
+    a, b = _permutations(num_perm, seed)
+    signature = np.full(num_perm, _MAX_HASH, dtype=np.uint64)
+    carry, seen_shingle = [], False
+    for chunk in read_text_chunks(path):
+        words = carry + chunk.lower().split()
+        if len(words) >= shingle_size:
+            _update_signature(signature, [" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)], a, b)
+            seen_shingle = True
+        carry = words[len(words) - shingle_size + 1:] if shingle_size > 1 else []
+    if not seen_shingle and carry:
+        _update_signature(signature, [" ".join(carry)], a, b)
+    return signature.astype(np.uint32)
+
+def lsh_params(threshold, num_perm):
+    # bands x rows whose S-curve (1/bands) ** (1/rows) sits closest to the similarity threshold
+    candidates = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm // rows > 0]
+    return min(candidates, key=lambda params: abs((1 / params[0]) ** (1 / params[1]) - threshold))
+
+def _load_signature_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return {}
+    with np.load(cache_path) as cached:
+        return {key: cached[key] for key in cached.files}
+
+def _find(parent, item):
+    while parent[item] != item:
+        parent[item] = parent[parent[item]]
+        item = parent[item]
+    return item
+
+def dedup_files(file_paths, threshold=0.85, num_perm=128, shingle_size=5, num_proc=None, cache_dir="./data/.dedup_cache", tokenizer=None):
+    file_paths = sorted(file_paths)
+    hashes = [file_sha256(path) for path in file_paths]
+
+    # exact duplicates: identical bytes, keep the first path in sorted order
+    first_by_hash = {}
+    for path, content_hash in zip(file_paths, hashes):
+        first_by_hash.setdefault(content_hash, path)
+    exact_dropped = [path for path, content_hash in zip(file_paths, hashes) if first_by_hash[content_hash] != path]
+    unique_hashes = list(first_by_hash)
+
+    # signatures are cached by content hash, so only new or edited files are shingled
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, f"minhash_p{num_perm}_s{shingle_size}.npz")
+    signatures = _load_signature_cache(cache_path)
+    missing = [content_hash for content_hash in unique_hashes if content_hash not in signatures]
+    if missing:
+        with ProcessPoolExecutor(max_workers=num_proc or os.cpu_count()) as pool:
+            computed = pool.map(partial(minhash_file, num_perm=num_perm, shingle_size=shingle_size), [first_by_hash[content_hash] for content_hash in missing], chunksize=8)
+            signatures.update(zip(missing, computed))
+        np.savez(cache_path, **signatures)
+
+    bands, rows = lsh_params(threshold, num_perm)
+    buckets = {}
+    parent = list(range(len(unique_hashes)))
+    for index, content_hash in enumerate(unique_hashes):
+        signature = signatures[content_hash]
+        for band in range(bands):
+            key = (band, signature[band * rows:(band + 1) * rows].tobytes())
+            for other in buckets.setdefault(key, []):
+                # LSH only proposes candidates, confirm on the estimated Jaccard similarity
+                if _find(parent, index) != _find(parent, other) and np.mean(signature == signatures[unique_hashes[other]]) >= threshold:
+                    parent[max(_find(parent, index), _find(parent, other))] = min(_find(parent, index), _find(parent, other))
+            buckets[key].append(index)
+
+    kept = [first_by_hash[content_hash] for index, content_hash in enumerate(unique_hashes) if _find(parent, index) == index]
+    near_dropped = [first_by_hash[content_hash] for index, content_hash in enumerate(unique_hashes) if _find(parent, index) != index]
+
+    dropped = exact_dropped + near_dropped
+    if tokenizer is not None:
+        saved = sum(len(tokenizer(chunk, add_special_tokens=False)["input_ids"]) for path in dropped for chunk in read_text_chunks(path))
+        unit = "tokens"
+    else:
+        saved = sum(os.path.getsize(path) for path in dropped)
+        unit = "bytes"
+    print(f"Dedup: kept {len(kept)} of {len(file_paths)} files, dropped {len(exact_dropped)} exact and {len(near_dropped)} near duplicates ({saved} {unit} saved)")
+    return kept
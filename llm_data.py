@@ -0,0 +1,253 @@
+import os
+import json
+import random
+import hashlib
+import shutil
+import torch
+import pyarrow.compute as pc
+from datasets import Dataset, load_from_disk
+
+def split_files(file_paths, test_size, seed):
+    # split whole documents so no document ends up in both train and eval
+    file_paths = sorted(file_paths)
+    random.Random(seed).shuffle(file_paths)
+    num_test = max(1, round(len(file_paths) * test_size)) if test_size > 0 and len(file_paths) > 1 else 0
+    return file_paths[num_test:], file_paths[:num_test]
+
+def read_text_chunks(path, chunk_chars=1 << 16):
+    # read a file in bounded pieces, cutting at whitespace so no word is split between two tokenizer calls
+    carry = ""
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            block = f.read(chunk_chars)
+            if not block:
+                break
+            text = carry + block
+            cut = max(text.rfind("\n"), text.rfind(" "))
+            if cut < 0:
+                carry = text
+                continue
+            # the whitespace starts the next piece, BPE tokenizers attach it to the word that follows
+            carry = text[cut:]
+            if text[:cut].strip():
+                yield text[:cut]
+    if carry.strip():
+        yield carry
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["files"]
+
+def save_manifest(path, file_paths):
+    # records which corpus files (by content hash) the saved adapter has been trained on
+    manifest = {"files": {os.path.basename(file_path): file_sha256(file_path) for file_path in sorted(file_paths)}}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def split_incremental(file_paths, manifest, replay_fraction=0.0, seed=0, test_size=0.0):
+    # new or edited files are all trained on, plus an optional replay sample of already-trained ones
+    # so the adapter does not drift away from the old data. The eval files come from the already-trained
+    # files that are not replayed, so no new file is held out and then recorded as trained
+    new_files, old_files = [], []
+    for file_path in sorted(file_paths):
+        trained = manifest.get(os.path.basename(file_path)) == file_sha256(file_path)
+        (old_files if trained else new_files).append(file_path)
+    if not new_files:
+        return new_files, [], []
+    rng = random.Random(seed)
+    replay_files = rng.sample(old_files, round(len(old_files) * replay_fraction))
+    replayed = set(replay_files)
+    unused_files = [file_path for file_path in old_files if file_path not in replayed]
+    test_files = rng.sample(unused_files, min(len(unused_files), max(1, round(len(old_files) * test_size)))) if test_size > 0 else []
+    print(f"Incremental: {len(new_files)} new or changed files, replaying {len(replay_files)} and evaluating on {len(test_files)} of {len(old_files)} already trained")
+    return new_files, replay_files, test_files
+
+def file_signatures(file_paths):
+    return [(path, os.path.getsize(path), os.path.getmtime(path)) for path in file_paths]
+
+def _chunk_batches(file_paths, batch_size):
+    batch = []
+    for path in file_paths:
+        for chunk in read_text_chunks(path):
+            batch.append((path, chunk))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def token_windows(file_paths, tokenizer, max_length, stride=0, append_eos=False, signatures=None, batch_size=128):
+    # stream each document as successive max_length token windows overlapping by stride tokens,
+    # so long documents are used in full instead of being truncated.
+    # Chunks from consecutive files are tokenized together in batch_size calls so the fast tokenizer
+    # can batch them. signatures is unused here, it only makes datasets' generator cache key change
+    # when a file is edited.
+    if not 0 <= stride < max_length:
+        raise ValueError(f"stride must be in [0, {max_length}), got {stride}")
+    step = max_length - stride
+    
+    def tail(buffer, emitted):
+        if append_eos and (buffer or emitted):
+            buffer.append(tokenizer.eos_token_id)
+        # after a full window the first stride tokens of the tail were already seen
+        if len(buffer) > (stride if emitted else 0):
+            yield {"input_ids": buffer}
+    
+    current_path, buffer, emitted = None, [], False
+    for batch in _chunk_batches(file_paths, batch_size):
+        encoded = tokenizer([chunk for _, chunk in batch], add_special_tokens=False)["input_ids"]
+        for (path, _), ids in zip(batch, encoded):
+            if path != current_path:
+                yield from tail(buffer, emitted)
+                current_path, buffer, emitted = path, [], False
+            buffer.extend(ids)
+            while len(buffer) >= max_length:
+                yield {"input_ids": buffer[:max_length]}
+                buffer = buffer[step:]
+                emitted = True
+    yield from tail(buffer, emitted)
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def tokenizer_fingerprint(tokenizer):
+    # the serialized fast tokenizer covers vocab, merges and normalization, not just the model name
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    identity = backend.to_str() if backend is not None else json.dumps(tokenizer.get_vocab(), sort_keys=True)
+    return hashlib.sha256(f"{type(tokenizer).__name__}:{tokenizer.name_or_path}:{identity}".encode("utf-8")).hexdigest()
+
+def corpus_cache_key(file_paths, tokenizer, **settings):
+    digest = hashlib.sha256()
+    for path in file_paths:
+        digest.update(f"{os.path.basename(path)}:{file_sha256(path)}\n".encode("utf-8"))
+    digest.update(tokenizer_fingerprint(tokenizer).encode("utf-8"))
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:24]
+
+def load_token_windows(file_paths, tokenizer, max_length, stride=0, append_eos=False, cache_dir="./data/.token_cache", num_proc=None):
+    # tokenized windows are saved as Arrow under a key of file contents, tokenizer and settings,
+    # so a rerun on an unchanged corpus loads them without tokenizing anything
+    key = corpus_cache_key(file_paths, tokenizer, max_length=max_length, stride=stride, append_eos=append_eos)
+    cache_path = os.path.join(cache_dir, key)
+    if os.path.isdir(cache_path):
+        print(f"Loaded tokenized corpus from {cache_path}")
+        return load_from_disk(cache_path)
+    
+    num_proc = min(num_proc or os.cpu_count() or 1, max(len(file_paths), 1))
+    dataset = Dataset.from_generator(
+        token_windows,
+        gen_kwargs={
+            "file_paths": file_paths,
+            "tokenizer": tokenizer,
+            "max_length": max_length,
+            "stride": stride,
+            "append_eos": append_eos,
+            "signatures": file_signatures(file_paths),
+        },
+        # list kwargs are sharded file-wise across the worker processes
+        num_proc=num_proc if num_proc > 1 else None,
+    )
+    tmp_path = cache_path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    dataset.save_to_disk(tmp_path)
+    os.replace(tmp_path, cache_path)
+    return load_from_disk(cache_path)
+
+def pack_sequences(dataset, block_size, batch_size=1000):
+    # concatenate token windows (documents end in EOS) and cut the stream into full block_size rows,
+    # keeping a per-token window index so the collator can mask attention across documents
+    def pack(examples):
+        buffer, buffer_docs = [], []
+        for doc_index, ids in enumerate(examples["input_ids"]):
+            buffer.extend(ids)
+            buffer_docs.extend([doc_index] * len(ids))
+        return {
+            "input_ids": [buffer[i:i + block_size] for i in range(0, len(buffer), block_size)],
+            "document_ids": [buffer_docs[i:i + block_size] for i in range(0, len(buffer), block_size)],
+            "length": [min(block_size, len(buffer) - i) for i in range(0, len(buffer), block_size)],
+        }
+
+    packed = dataset.map(pack, batched=True, batch_size=batch_size, remove_columns=dataset.column_names)
+    # summed in Arrow, pulling input_ids into Python lists would load the whole packed split into memory
+    real_tokens = pc.sum(packed.data.column("length")).as_py() or 0
+    print(f"Packed {len(dataset)} windows into {len(packed)} blocks of {block_size} tokens ({real_tokens / max(len(packed) * block_size, 1):.1%} filled)")
+    return packed
+
+def add_length_column(dataset):
+    # lets Trainer's group_by_length sampler read lengths without decoding every row
+    return dataset.map(lambda examples: {"length": [len(ids) for ids in examples["input_ids"]]}, batched=True)
+
+class DynamicPaddingCollator:
+    # pads each batch only to its longest row (rounded up for tensor cores) and masks labels by position,
+    # so EOS tokens stay trainable even though pad == eos. Keeps running totals of samples and real vs padded
+    # tokens for reporting, which only works with dataloader_num_workers=0 since workers hold their own copy.
+    def __init__(self, pad_token_id, pad_to_multiple_of=8):
+        self.pad_token_id = pad_token_id
+        self.pad_to_multiple_of = pad_to_multiple_of
+        self.samples = 0
+        self.real_tokens = 0
+        self.padded_tokens = 0
+
+    def __call__(self, features):
+        length = max(len(feature["input_ids"]) for feature in features)
+        length = -(-length // self.pad_to_multiple_of) * self.pad_to_multiple_of
+        input_ids = torch.full((len(features), length), self.pad_token_id, dtype=torch.long)
+        labels = torch.full((len(features), length), -100, dtype=torch.long)
+        attention_mask = torch.zeros((len(features), length), dtype=torch.long)
+
+        for row, feature in enumerate(features):
+            n = len(feature["input_ids"])
+            ids = torch.tensor(feature["input_ids"], dtype=torch.long)
+            input_ids[row, :n] = ids
+            labels[row, :n] = ids
+            attention_mask[row, :n] = 1
+
+        self.samples += len(features)
+        self.real_tokens += int(attention_mask.sum())
+        self.padded_tokens += attention_mask.numel()
+        return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
+
+    def stats(self):
+        return {"samples": self.samples, "real_tokens": self.real_tokens, "padded_tokens": self.padded_tokens}
+
+class PackedDataCollator(DynamicPaddingCollator):
+    def __init__(self, pad_token_id, boundary_masking=False, mask_dtype=torch.float16, pad_to_multiple_of=8):
+        super().__init__(pad_token_id, pad_to_multiple_of)
+        self.boundary_masking = boundary_masking
+        self.mask_dtype = mask_dtype
+
+    def __call__(self, features):
+        batch = super().__call__(features)
+        if not self.boundary_masking:
+            return batch
+
+        length = batch["input_ids"].shape[1]
+        document_ids = torch.full((len(features), length), -1, dtype=torch.long)
+        position_ids = torch.zeros((len(features), length), dtype=torch.long)
+        for row, feature in enumerate(features):
+            n = len(feature["input_ids"])
+            docs = torch.tensor(feature["document_ids"], dtype=torch.long)
+            positions = torch.arange(n)
+            starts = torch.ones(n, dtype=torch.bool)
+            starts[1:] = docs[1:] != docs[:-1]
+            # positions restart at every document and its first token is not predicted from the previous one
+            doc_start = torch.cummax(torch.where(starts, positions, torch.zeros_like(positions)), dim=0).values
+            position_ids[row, :n] = positions - doc_start
+            batch["labels"][row, :n][starts] = -100
+            document_ids[row, :n] = docs
+
+        causal = torch.tril(torch.ones(length, length, dtype=torch.bool))
+        allowed = (document_ids[:, :, None] == document_ids[:, None, :]) & causal & (document_ids[:, None, :] >= 0)
+        allowed |= torch.eye(length, dtype=torch.bool)
+        mask = torch.zeros(allowed.shape, dtype=self.mask_dtype)
+        batch["attention_mask"] = mask.masked_fill(~allowed, torch.finfo(self.mask_dtype).min)[:, None]
+        batch["position_ids"] = position_ids
+        return batch
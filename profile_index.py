@@ -0,0 +1,241 @@
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+# how much each profile section counts when a job is scored against a candidate
+SECTION_WEIGHTS = {"skills": 0.4, "workExperience": 0.35, "projects": 0.25}
+
+# the embedding model only reads the first 256 word pieces of a text; this many words stay under that
+CHUNK_WORDS = 150
+
+def chunk_words(text, max_words=CHUNK_WORDS):
+    words = text.split()
+    return [" ".join(words[start:start + max_words]) for start in range(0, len(words), max_words)]
+
+def profile_sections(profile):
+    # a list of entry texts per section (one per job or project, skills in groups), empty sections are left out
+    skills = [skill.get("name", "") for skill in profile.get("skills", []) if skill.get("name")]
+    sections = {
+        "skills": [", ".join(skills[start:start + 20]) for start in range(0, len(skills), 20)],
+        "workExperience": [
+            " ".join([f"{work.get('position', '')} at {work.get('company', '')}."] + work.get("description", []))
+            for work in profile.get("workExperience", [])
+        ],
+        "projects": [
+            " ".join([f"{project.get('name', '')} ({', '.join(project.get('technologies', []))})."] + project.get("description", []))
+            for project in profile.get("projects", [])
+        ],
+    }
+    return {section: [text for text in texts if text.strip()] for section, texts in sections.items() if any(text.strip() for text in texts)}
+
+def job_text(job):
+    return f"{job.get('title', '')} at {job.get('company', '')}\n{job.get('description', '') or ''}".strip()
+
+class VectorIndex:
+    # unit-length vectors in one contiguous (capacity, dim) matrix that grows by doubling; row ids map to
+    # positions and a removed row is filled with the last one, so rows stay packed. Search is exact:
+    # a blocked matrix product in float32, whatever the storage dtype
+    def __init__(self, dim, dtype=np.float32):
+        self.dim = dim
+        self.matrix = np.zeros((0, dim), dtype=dtype)
+        self.ids = []
+        self.positions = {}
+        self.hashes = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def vectors(self):
+        return self.matrix[:len(self.ids)]
+
+    def _reserve(self, rows):
+        if rows > len(self.matrix):
+            grown = np.zeros((max(rows, 2 * len(self.matrix), 1024), self.dim), dtype=self.matrix.dtype)
+            grown[:len(self.ids)] = self.vectors
+            self.matrix = grown
+
+    def upsert(self, ids, vectors, hashes):
+        new_ids = [row_id for row_id in ids if row_id not in self.positions]
+        self._reserve(len(self.ids) + len(new_ids))
+        for row_id in new_ids:
+            self.positions[row_id] = len(self.ids)
+            self.ids.append(row_id)
+        self.matrix[[self.positions[row_id] for row_id in ids]] = vectors
+        self.hashes.update(zip(ids, hashes))
+
+    def remove(self, ids):
+        for row_id in ids:
+            position = self.positions.pop(row_id, None)
+            if position is None:
+                continue
+            last_id = self.ids.pop()
+            if last_id != row_id:
+                self.matrix[position] = self.matrix[len(self.ids)]
+                self.ids[position] = last_id
+                self.positions[last_id] = position
+            self.hashes.pop(row_id, None)
+
+    def scores(self, queries, block_rows=65536):
+        # (rows, queries) cosine similarities
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        out = np.empty((len(self.ids), len(queries)), dtype=np.float32)
+        for start in range(0, len(self.ids), block_rows):
+            out[start:start + block_rows] = self.matrix[start:min(start + block_rows, len(self.ids))].astype(np.float32) @ queries.T
+        return out
+
+    def search(self, queries, k=10):
+        # top-k (id, score) lists, one per query row
+        scores = self.scores(queries)
+        k = min(k, len(self.ids))
+        if k == 0:
+            return [[] for _ in range(scores.shape[1])]
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        results = []
+        for column in range(scores.shape[1]):
+            rows = top[np.argsort(-scores[top[:, column], column]), column]
+            results.append([(self.ids[row], float(scores[row, column])) for row in rows])
+        return results
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, vectors=self.vectors, ids=np.array(self.ids, dtype=object), hashes=np.array([self.hashes[row_id] for row_id in self.ids], dtype=object))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, dim, dtype=np.float32):
+        index = cls(dim, dtype)
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=True) as saved:
+                if saved["vectors"].shape[1:] == (dim,):
+                    index.upsert(list(saved["ids"]), saved["vectors"].astype(dtype), list(saved["hashes"]))
+        return index
+
+class ProfileIndex:
+    # profile sections (row id "<profile id>#<section>") and job postings embedded with a local
+    # sentence-embedding model. Every entry of a section is embedded on its own, long ones in chunks, and
+    # a row is the normalized mean of those vectors. Rows carry a hash of model and texts, so an upsert
+    # only embeds what changed
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2", dtype=np.float16, index_dir=None, batch_size=64):
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.batch_size = batch_size
+        self.index_dir = index_dir
+        dim = self.model.get_sentence_embedding_dimension()
+        load = (lambda name: VectorIndex.load(os.path.join(index_dir, name), dim, dtype)) if index_dir else (lambda name: VectorIndex(dim, dtype))
+        self.sections = load("sections.npz")
+        self.jobs = load("jobs.npz")
+
+    def _hash(self, chunks):
+        return hashlib.sha256(json.dumps([self.model_name, chunks]).encode("utf-8")).hexdigest()
+
+    def _upsert(self, index, texts):
+        # texts: row id -> list of entry texts. Returns how many rows had to be embedded
+        chunked = {row_id: [chunk for text in entries for chunk in chunk_words(text)] for row_id, entries in texts.items()}
+        changed = [(row_id, chunks, self._hash(chunks)) for row_id, chunks in chunked.items() if chunks]
+        changed = [(row_id, chunks, content_hash) for row_id, chunks, content_hash in changed if index.hashes.get(row_id) != content_hash]
+        if changed:
+            flat = [chunk for _, chunks, _ in changed for chunk in chunks]
+            vectors = self.model.encode(flat, batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True)
+            bounds = np.cumsum([0] + [len(chunks) for _, chunks, _ in changed])
+            pooled = np.stack([vectors[start:stop].mean(axis=0) for start, stop in zip(bounds[:-1], bounds[1:])])
+            pooled /= np.linalg.norm(pooled, axis=1, keepdims=True)
+            index.upsert([row_id for row_id, _, _ in changed], pooled.astype(index.matrix.dtype), [content_hash for _, _, content_hash in changed])
+        return len(changed)
+
+    def upsert_profiles(self, profiles):
+        # profiles: profile id -> shaped profile. Sections a profile no longer has are dropped
+        texts = {}
+        for profile_id, profile in profiles.items():
+            sections = profile_sections(profile)
+            texts.update({f"{profile_id}#{section}": text for section, text in sections.items()})
+            self.sections.remove([f"{profile_id}#{section}" for section in SECTION_WEIGHTS if section not in sections])
+        return self._upsert(self.sections, texts)
+
+    def upsert_jobs(self, jobs):
+        # jobs: job id -> {"company", "title", "description"}
+        return self._upsert(self.jobs, {job_id: [job_text(job)] for job_id, job in jobs.items()})
+
+    def remove_profiles(self, profile_ids):
+        self.sections.remove([f"{profile_id}#{section}" for profile_id in profile_ids for section in SECTION_WEIGHTS])
+
+    def sync_profiles(self, profiles):
+        # upsert profiles and drop indexed ones that are no longer in it. Returns (embedded rows, removed profiles)
+        stale = {row_id.rsplit("#", 1)[0] for row_id in self.sections.ids} - set(profiles)
+        self.remove_profiles(stale)
+        return self.upsert_profiles(profiles), len(stale)
+
+    def rank_candidates(self, job_id, k=10):
+        # profiles by the weighted similarity of their sections to the job, missing sections count 0
+        if job_id not in self.jobs.positions:
+            raise KeyError(f"job {job_id!r} is not in the index, add it with --jobs first")
+        query = self.jobs.vectors[self.jobs.positions[job_id]]
+        section_scores = self.sections.scores(query)[:, 0]
+        totals = {}
+        for row_id, score in zip(self.sections.ids, section_scores):
+            profile_id, section = row_id.rsplit("#", 1)
+            totals[profile_id] = totals.get(profile_id, 0.0) + SECTION_WEIGHTS[section] * float(score)
+        return sorted(totals.items(), key=lambda item: -item[1])[:k]
+
+    def match_jobs(self, profile_id, k=10):
+        # jobs closest to the weighted mean of the profile's section vectors
+        rows = [(self.sections.positions[f"{profile_id}#{section}"], weight) for section, weight in SECTION_WEIGHTS.items() if f"{profile_id}#{section}" in self.sections.positions]
+        if not rows:
+            return []
+        query = sum(self.sections.matrix[position].astype(np.float32) * weight for position, weight in rows)
+        return self.jobs.search(query / np.linalg.norm(query), k)[0]
+
+    def save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.sections.save(os.path.join(self.index_dir, "sections.npz"))
+        self.jobs.save(os.path.join(self.index_dir, "jobs.npz"))
+
+def load_profiles(path):
+    # the JSONL written by the bulk resume ingestion, keyed by source file
+    profiles = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                profiles[record["file"]] = record["profile"]
+    return profiles
+
+def load_jobs(path):
+    # a JSON list (or JSONL) of job documents with an "id"
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    jobs = json.loads(content) if content.lstrip().startswith("[") else [json.loads(line) for line in content.splitlines() if line.strip()]
+    return {job["id"]: job for job in jobs}
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--profiles", default="profiles.jsonl", help="JSONL from the bulk resume ingestion")
+    arg_parser.add_argument("--jobs", default=None, help="JSON list or JSONL of job documents")
+    arg_parser.add_argument("--index-dir", default="./.profile_index")
+    arg_parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    arg_parser.add_argument("--float32", action="store_true", help="store vectors in float32 instead of float16")
+    arg_parser.add_argument("--rank-job", default=None, help="print the best matching candidates for this job id")
+    arg_parser.add_argument("--match-profile", default=None, help="print the best matching jobs for this profile id")
+    arg_parser.add_argument("-k", type=int, default=10)
+    args = arg_parser.parse_args()
+
+    index = ProfileIndex(args.model, np.float32 if args.float32 else np.float16, args.index_dir)
+    if os.path.exists(args.profiles):
+        # the JSONL is the full set of profiles, ones no longer in it are removed from the index
+        embedded, removed = index.sync_profiles(load_profiles(args.profiles))
+        print(f"Embedded {embedded} changed profile sections, removed {removed} profiles ({len(index.sections)} sections indexed)")
+    if args.jobs:
+        print(f"Embedded {index.upsert_jobs(load_jobs(args.jobs))} changed jobs ({len(index.jobs)} indexed)")
+    index.save()
+
+    if args.rank_job:
+        if args.rank_job not in index.jobs.positions:
+            arg_parser.error(f"job {args.rank_job!r} is not in the index, add it with --jobs first")
+        for profile_id, score in index.rank_candidates(args.rank_job, args.k):
+            print(f"{score:.3f}  {profile_id}")
+    if args.match_profile:
+        for job_id, score in index.match_jobs(args.match_profile, args.k):
+            print(f"{score:.3f}  {job_id}")
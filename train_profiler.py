@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import statistics
+from contextlib import contextmanager
+import torch
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+PHASES = ["data_wait", "forward", "backward", "optimizer"]
+
+def _sync():
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+def _cpu_peak_mb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class StepProfiler:
+    # output_dir=None gives a disabled profiler whose calls are all no-ops,
+    # so training loops can call it unconditionally
+    def __init__(self, output_dir=None, start_step=5, num_steps=20, rank=0):
+        self.output_dir = output_dir
+        self.start_step = start_step
+        self.num_steps = num_steps
+        self.rank = rank
+        self.global_step = 0
+        self.steps = []
+        self._current = None
+        self._step_start = None
+        self._open_phases = {}
+        self._last_step_end = None
+        self._torch_profiler = None
+        self._closed = False
+
+    @property
+    def enabled(self):
+        return self.output_dir is not None and not self._closed
+
+    def _in_window(self):
+        return self.enabled and self.start_step <= self.global_step < self.start_step + self.num_steps
+
+    def start(self):
+        if not self.enabled or self._torch_profiler is not None:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self._torch_profiler = torch.profiler.profile(
+            activities=activities,
+            # one warmup step just before the window so the traced steps line up with the timed ones
+            schedule=torch.profiler.schedule(skip_first=max(self.start_step - 1, 0), wait=0, warmup=min(self.start_step, 1), active=self.num_steps, repeat=1),
+            on_trace_ready=lambda prof: prof.export_chrome_trace(os.path.join(self.output_dir, f"trace_rank{self.rank}.json")),
+            profile_memory=True,
+            with_stack=False,
+        )
+        self._torch_profiler.__enter__()
+
+    def mark_data_start(self):
+        # call when the loop starts waiting for a batch after non-step work (epoch start, eval, saving)
+        self._last_step_end = time.perf_counter()
+
+    def begin_step(self):
+        if not self._in_window():
+            return
+        now = time.perf_counter()
+        self._current = {"step": self.global_step, **{phase: 0.0 for phase in PHASES}}
+        if self._last_step_end is not None:
+            self._current["data_wait"] = now - self._last_step_end
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        self._step_start = now
+
+    def begin_phase(self, name):
+        if self._current is None:
+            return
+        _sync()
+        record = torch.profiler.record_function(name)
+        record.__enter__()
+        self._open_phases[name] = (time.perf_counter(), record)
+
+    def end_phase(self, name):
+        if self._current is None or name not in self._open_phases:
+            return
+        _sync()
+        start, record = self._open_phases.pop(name)
+        record.__exit__(None, None, None)
+        self._current[name] = self._current.get(name, 0.0) + time.perf_counter() - start
+
+    @contextmanager
+    def phase(self, name):
+        self.begin_phase(name)
+        try:
+            yield
+        finally:
+            self.end_phase(name)
+
+    def end_step(self):
+        if not self.enabled:
+            return
+        if self._current is not None:
+            _sync()
+            self._current["total"] = time.perf_counter() - self._step_start + self._current["data_wait"]
+            if torch.cuda.is_available():
+                self._current["peak_gpu_memory_mb"] = torch.cuda.max_memory_allocated() / 2**20
+            self._current["peak_cpu_memory_mb"] = _cpu_peak_mb()
+            self.steps.append(self._current)
+            self._current = None
+        if self._torch_profiler is not None:
+            self._torch_profiler.step()
+        self.global_step += 1
+        self._last_step_end = time.perf_counter()
+        if self.global_step >= self.start_step + self.num_steps:
+            self.close()
+
+    def summary(self):
+        result = {"rank": self.rank, "start_step": self.start_step, "steps_recorded": len(self.steps), "phases": {}}
+        for phase in PHASES + ["total"]:
+            values = [step[phase] for step in self.steps if phase in step]
+            if values:
+                result["phases"][phase] = {
+                    "mean_s": statistics.mean(values),
+                    "median_s": statistics.median(values),
+                    "max_s": max(values),
+                    "share": sum(values) / max(sum(step["total"] for step in self.steps), 1e-12) if phase != "total" else 1.0,
+                }
+        gpu_peaks = [step["peak_gpu_memory_mb"] for step in self.steps if "peak_gpu_memory_mb" in step]
+        result["peak_gpu_memory_mb"] = max(gpu_peaks) if gpu_peaks else None
+        result["peak_cpu_memory_mb"] = _cpu_peak_mb()
+        result["per_step"] = self.steps
+        return result
+
+    def close(self):
+        if not self.enabled:
+            return
+        self._closed = True
+        if self._torch_profiler is not None:
+            self._torch_profiler.__exit__(None, None, None)
+            self._torch_profiler = None
+        summary = self.summary()
+        with open(os.path.join(self.output_dir, f"step_summary_rank{self.rank}.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        phases = summary["phases"]
+        print("Step profile: " + ", ".join(f"{name} {stats['mean_s'] * 1000:.1f}ms" for name, stats in phases.items()))
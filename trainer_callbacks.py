@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import torch
+from transformers import Trainer, TrainerCallback
+
+class ProfilerCallback(TrainerCallback):
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.profiler.start()
+        self.profiler.mark_data_start()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self.profiler.begin_step()
+
+    def on_pre_optimizer_step(self, args, state, control, **kwargs):
+        self.profiler.begin_phase("optimizer")
+
+    def on_optimizer_step(self, args, state, control, **kwargs):
+        self.profiler.end_phase("optimizer")
+
+    def on_step_end(self, args, state, control, **kwargs):
+        self.profiler.end_step()
+
+    # evaluation and checkpointing run between steps and are not data loading
+    def on_evaluate(self, args, state, control, **kwargs):
+        self.profiler.mark_data_start()
+
+    def on_save(self, args, state, control, **kwargs):
+        self.profiler.mark_data_start()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self.profiler.close()
+
+def _stats_delta(current, previous):
+    return {key: current[key] - previous.get(key, 0) for key in current}
+
+class PaddingStatsCallback(TrainerCallback):
+    def __init__(self, collator):
+        self.collator = collator
+        self.last_step = 0
+        self.last_stats = {}
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        # eval batches go through the same collator, they are dropped at the eval log where no step has passed
+        current = self.collator.stats()
+        stats = _stats_delta(current, self.last_stats)
+        steps = state.global_step - self.last_step
+        self.last_stats, self.last_step = current, state.global_step
+        if not stats["padded_tokens"] or not steps:
+            return
+        padding_ratio = 1 - stats["real_tokens"] / stats["padded_tokens"]
+        print(f"step {state.global_step}: padding ratio {padding_ratio:.1%}, {stats['real_tokens'] / steps:.0f} real tokens per step")
+
+class ThroughputCallback(TrainerCallback):
+    # peak_tflops is the per-device dense bf16 peak of the hardware, MFU is only reported when it is given
+    def __init__(self, collator, peak_tflops=None):
+        self.collator = collator
+        self.peak_tflops = peak_tflops
+        self.writer = None
+        self.records = []
+        self.num_params = 0
+        self.flops_per_token = 0
+        self.step_start = None
+        self.last_step_end = None
+        self.optimizer_start = None
+        self.window = {"data": 0.0, "compute": 0.0, "optimizer": 0.0}
+        self.total_step_time = 0.0
+        self.total_steps = 0
+        self.last_log_time = None
+        self.last_step = 0
+        self.last_stats = {}
+
+    def _now(self):
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def on_train_begin(self, args, state, control, model=None, **kwargs):
+        if state.is_world_process_zero:
+            from torch.utils.tensorboard import SummaryWriter
+            self.writer = SummaryWriter(log_dir=args.logging_dir)
+        self.num_params = sum(param.numel() for param in model.parameters())
+        # forward 2N, backward through frozen weights 2N (+2N for LoRA weight grads is negligible),
+        # and gradient checkpointing recomputes the forward: a rough dense-transformer estimate
+        self.flops_per_token = (6 if args.gradient_checkpointing else 4) * self.num_params
+        self.last_log_time = self.last_step_end = self._now()
+        self.last_stats = self.collator.stats()
+        self.last_step = state.global_step
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self.step_start = self._now()
+        self.window["data"] += self.step_start - self.last_step_end
+
+    def on_pre_optimizer_step(self, args, state, control, **kwargs):
+        self.optimizer_start = self._now()
+
+    def on_optimizer_step(self, args, state, control, **kwargs):
+        self.window["optimizer"] += self._now() - self.optimizer_start
+
+    def on_step_end(self, args, state, control, **kwargs):
+        self.last_step_end = self._now()
+        step_time = self.last_step_end - self.step_start
+        self.window["compute"] += step_time
+        self.total_step_time += step_time
+        self.total_steps += 1
+
+    def on_evaluate(self, args, state, control, **kwargs):
+        self.last_step_end = self._now()
+
+    def on_save(self, args, state, control, **kwargs):
+        self.last_step_end = self._now()
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        now = self._now()
+        current = self.collator.stats()
+        stats = _stats_delta(current, self.last_stats)
+        steps = state.global_step - self.last_step
+        elapsed = now - self.last_log_time
+        self.last_stats, self.last_step, self.last_log_time = current, state.global_step, now
+        if not steps or elapsed <= 0:
+            return
+        # collator counters are per process, scale to the whole job
+        world = args.world_size
+        record = {
+            "step": state.global_step,
+            "real_tokens_per_sec": stats["real_tokens"] * world / elapsed,
+            "padded_tokens_per_sec": stats["padded_tokens"] * world / elapsed,
+            "samples_per_sec": stats["samples"] * world / elapsed,
+            "step_time_s": elapsed / steps,
+            "data_time_s": self.window["data"] / steps,
+            "optimizer_time_s": self.window["optimizer"] / steps,
+            "compute_time_s": (self.window["compute"] - self.window["optimizer"]) / steps,
+            "eta_s": (state.max_steps - state.global_step) * self.total_step_time / max(self.total_steps, 1),
+        }
+        if torch.cuda.is_available():
+            record["peak_memory_gb"] = torch.cuda.max_memory_allocated() / 2**30
+        achieved_tflops = record["padded_tokens_per_sec"] / world * self.flops_per_token / 1e12
+        record["achieved_tflops_per_device"] = achieved_tflops
+        if self.peak_tflops:
+            record["mfu"] = achieved_tflops / self.peak_tflops
+        self.window = {"data": 0.0, "compute": 0.0, "optimizer": 0.0}
+        self.records.append(record)
+
+        if self.writer is not None:
+            for key, value in record.items():
+                if key != "step":
+                    self.writer.add_scalar(f"throughput/{key}", value, state.global_step)
+            self.writer.flush()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if not state.is_world_process_zero:
+            return
+        if self.writer is not None:
+            self.writer.close()
+        summary = {"num_params": self.num_params, "flops_per_token": self.flops_per_token, "peak_tflops": self.peak_tflops, "log": self.records}
+        if self.records:
+            for key in self.records[0]:
+                if key not in ("step", "eta_s"):
+                    summary[f"mean_{key}"] = sum(record.get(key, 0) for record in self.records) / len(self.records)
+        with open(os.path.join(args.output_dir, "throughput_summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+
+class ProfiledTrainer(Trainer):
+    def __init__(self, *args, profiler, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.step_profiler = profiler
+        self.add_callback(ProfilerCallback(profiler))
+        # Trainer has no hook between forward and backward, so time backward by wrapping the accelerator call
+        backward = self.accelerator.backward
+        def timed_backward(loss, **backward_kwargs):
+            with self.step_profiler.phase("backward"):
+                return backward(loss, **backward_kwargs)
+        self.accelerator.backward = timed_backward
+
+    def compute_loss(self, model, inputs, *args, **kwargs):
+        if not model.training:
+            return super().compute_loss(model, inputs, *args, **kwargs)
+        with self.step_profiler.phase("forward"):
+            return super().compute_loss(model, inputs, *args, **kwargs)